@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# numbers of virtual heaters, each measured in its own process
+default_counts = [3, 10, 30, 100]
+# repetitions of each entry point
+repetitions = 20
+# latency of each request to a virtual heater in seconds
+latency_seconds = 0.01
+
+
+def measure(function, simulator, solar_simulator, prepare=None) -> dict:
+    """ Measures an entry point of the manager.
+
+    :param function: function without parameters
+    :param simulator: TuyaSimulator counting the requests to the virtual heaters
+    :param solar_simulator: SolarSimulator counting the requests to the inverter
+    :param prepare: function without parameters called before each call of function, not measured
+    :return: dict with the wall time in milliseconds, the round trips per call and the allocations per call
+    """
+    prepare = prepare or (lambda: None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        prepare()
+        function()
+        simulator.reset_round_trips()
+        solar_simulator.request_count = 0
+        times = []
+        for i in range(repetitions):
+            prepare()
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        round_trips = simulator.get_round_trips() / repetitions
+        inverter_requests = solar_simulator.request_count / repetitions
+        prepare()
+        tracemalloc.start()
+        snapshot_before = tracemalloc.take_snapshot()
+        function()
+        snapshot_after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    statistics = snapshot_after.compare_to(snapshot_before, "filename")
+    times.sort()
+    return {"mean_ms": 1000 * sum(times) / len(times),
+            "median_ms": 1000 * times[len(times) // 2],
+            "max_ms": 1000 * times[-1],
+            "device_round_trips": round_trips,
+            "inverter_requests": inverter_requests,
+            "allocated_blocks": sum(max(s.count_diff, 0) for s in statistics),
+            "peak_kib": peak / 1024}
+
+
+def expire_status_snapshots(heater_list) -> None:
+    """ Lets the next access to each heater request the device instead of reusing its status snapshot. """
+    for heater in heater_list:
+        heater.statusSnapshotTime = 0
+
+
+def run_count(count) -> dict:
+    """ Measures the entry points with the given number of virtual heaters. Has to run in a new process,
+        because the modules heat and manager create their Heaters and HeatSteps objects once.
+
+    :param count: number of virtual heaters
+    :return: dict: entry point -> measurement
+    """
+    from tuyaSimulator import TuyaSimulator
+    from solarSimulator import Recording, SolarSimulator
+
+    simulator = TuyaSimulator(count, latency_seconds=latency_seconds, latency_jitter_seconds=0, seed=1)
+    simulator.install()
+    heaters_file, heat_steps_file = simulator.write_definition_files()
+    solar_simulator = SolarSimulator(Recording.synthetic_day(seed=1), port=0, offset_seconds=12 * 3600)
+    solar_simulator.start_in_background()
+
+    import heaters
+    heaters.Heaters.heatersFile = heaters_file
+    import heatSteps
+    heatSteps.HeatSteps.heatStepsFile = heat_steps_file
+    import solar
+    solar.Solar.base_url = solar_simulator.get_url()
+    with contextlib.redirect_stdout(io.StringIO()):
+        import manager
+
+    manager.manager.set_verbose(False)
+    return {"cycle": measure(manager.manager.cycle, simulator, solar_simulator),
+            "status": measure(manager.status, simulator, solar_simulator),
+            "info": measure(lambda: manager.heat("info"), simulator, solar_simulator,
+                            lambda: expire_status_snapshots(manager.heaters.list))}
+
+
+def run(counts) -> dict:
+    """ Measures all numbers of virtual heaters, each in a new process.
+
+    :param counts: list of numbers of virtual heaters
+    :return: dict: number of heaters -> entry point -> measurement
+    """
+    results = {}
+    for count in counts:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--count", str(count)],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        results[count] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+def print_results(results) -> None:
+    print("%8s %-7s %10s %10s %10s %12s %10s %12s %10s" %
+          ("heaters", "entry", "mean ms", "median ms", "max ms", "device rt", "inverter", "alloc blocks",
+           "peak KiB"))
+    for count, entries in results.items():
+        for entry, m in entries.items():
+            print("%8d %-7s %10.2f %10.2f %10.2f %12.1f %10.1f %12d %10.1f" %
+                  (count, entry, m["mean_ms"], m["median_ms"], m["max_ms"], m["device_round_trips"],
+                   m["inverter_requests"], m["allocated_blocks"], m["peak_kib"]))
+
+
+# -------------------------------------------------------------------------------
+# Benchmark
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    # python3 benchmark.py [count ...] [--json]
+    # measures one cycle of the measure loop, status() and heat("info") against virtual heaters and a stand-in inverter
+    if len(sys.argv) > 2 and sys.argv[1] == "--count":
+        print(json.dumps(run_count(int(sys.argv[2]))))
+    else:
+        arguments = [argument for argument in sys.argv[1:] if argument != "--json"]
+        the_results = run([int(argument) for argument in arguments] or default_counts)
+        if "--json" in sys.argv:
+            print(json.dumps(the_results, indent=2))
+        else:
+            print_results(the_results)
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+import time
+
+
+class Clock:
+    """ Source of time for the manager, the heaters and the solar system.
+
+        By default this is the real time. In the virtual mode, used by simulation.py, sleeping does not
+        wait but advances the virtual time and informs a listener, e.g. a model of the house.
+    """
+
+    virtual = False
+    virtual_time = 0
+    # function called with the number of seconds whenever the virtual time advances
+    on_advance = None
+
+    def set_virtual(self, start_time, on_advance=None) -> None:
+        """ Switches to the virtual time.
+
+        :param start_time: virtual time to start with, in seconds since the epoch
+        :param on_advance: function with the advanced seconds as parameter
+        """
+        self.virtual = True
+        self.virtual_time = start_time
+        self.on_advance = on_advance
+
+    def set_real(self) -> None:
+        self.virtual = False
+        self.on_advance = None
+
+    def time(self) -> float:
+        return self.virtual_time if self.virtual else time.time()
+
+    def monotonic(self) -> float:
+        """ Returns seconds for measuring durations, which are not affected by changes of the system time. """
+        return self.virtual_time if self.virtual else time.monotonic()
+
+    def localtime(self):
+        return time.localtime(self.time())
+
+    def strftime(self, format) -> str:
+        return time.strftime(format, self.localtime())
+
+    def sleep(self, seconds) -> None:
+        if self.virtual:
+            self.__advance(seconds)
+        else:
+            time.sleep(seconds)
+
+    def wait(self, event, seconds) -> bool:
+        """ Waits for a threading.Event, but at most the given seconds.
+
+        :return: bool: True if the event is set
+        """
+        if not self.virtual:
+            return event.wait(seconds)
+        if not event.is_set():
+            self.__advance(seconds)
+        return event.is_set()
+
+    def __advance(self, seconds) -> None:
+        self.virtual_time += seconds
+        if self.on_advance is not None:
+            self.on_advance(seconds)
+
+
+clock = Clock()
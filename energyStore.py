@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+import sqlite3
+import threading
+
+from clock import *
+
+
+class EnergyStore:
+    """ Keeps the energy of the heaters and the readings of the solar system in a SQLite file,
+        so the totals survive a restart of the service.
+
+        The energy is stored as one row per heater and day. Readings are stored per cycle and
+        compacted to hourly averages after raw_reading_days. Writes are collected in memory and
+        written in one transaction every flush_seconds or after batch_size changes, so a crash
+        loses at most the last batch. The totals are kept in memory and only read once at start.
+    """
+
+    # writes are collected until this number of changes or seconds is reached
+    batch_size = 50
+    flush_seconds = 60
+    # readings older than this number of days are compacted to hourly averages
+    raw_reading_days = 7
+
+    connection = None
+    lock = None
+    # the day of current_watt_hours and the energy of all heaters of this day, month and year
+    current_day = None
+    current_watt_hours = None
+
+    def __init__(self, path):
+        """ Opens or creates the store.
+
+        :param path: SQLite file, ':memory:' for a temporary store
+        """
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS energy (
+                heater TEXT NOT NULL, day TEXT NOT NULL, watt_hours REAL NOT NULL,
+                PRIMARY KEY (heater, day)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS readings (
+                time REAL PRIMARY KEY, watt_pv REAL, watt_grid REAL, watt_akku REAL,
+                charged_percent REAL, available REAL, step_index INTEGER);
+            CREATE TABLE IF NOT EXISTS hourly_readings (
+                time REAL PRIMARY KEY, watt_pv REAL, watt_grid REAL, watt_akku REAL,
+                charged_percent REAL, available REAL, step_index REAL, count INTEGER);
+            CREATE TABLE IF NOT EXISTS properties (name TEXT PRIMARY KEY, value TEXT);
+        """)
+        # (heater, day) -> watt hours not yet written
+        self.pending_energy = {}
+        self.pending_readings = []
+        self.pending_count = 0
+        self.last_flush_time = clock.time()
+        self.totals = dict(self.connection.execute("SELECT heater, SUM(watt_hours) FROM energy GROUP BY heater"))
+
+    def add_watt_hours(self, heater_name, watt_hours) -> None:
+        """ Adds energy of a heater to the current day. """
+        if watt_hours <= 0:
+            return
+        key = (heater_name, clock.strftime("%Y-%m-%d"))
+        with self.lock:
+            self.pending_energy[key] = self.pending_energy.get(key, 0.0) + watt_hours
+            self.totals[heater_name] = self.totals.get(heater_name, 0.0) + watt_hours
+            if key[1] == self.current_day:
+                for period in self.current_watt_hours:
+                    self.current_watt_hours[period] += watt_hours
+            self.__count_change()
+
+    def add_reading(self, watt_pv, watt_grid, watt_akku, charged_percent, available, step_index) -> None:
+        """ Adds the readings of a manager cycle at the current time. """
+        with self.lock:
+            self.pending_readings.append((clock.time(), watt_pv, watt_grid, watt_akku, charged_percent, available,
+                                          step_index))
+            self.__count_change()
+
+    def __count_change(self) -> None:
+        self.pending_count += 1
+        if self.pending_count >= self.batch_size or clock.time() - self.last_flush_time >= self.flush_seconds:
+            self.flush()
+
+    def get_watt_hours(self, heater_name=None) -> float:
+        """ Returns the stored energy including the changes not yet written, without reading the file.
+
+        :param heater_name: name of a heater, None for the sum of all heaters
+        :return: float: Watt hours
+        """
+        with self.lock:
+            if heater_name is None:
+                return sum(self.totals.values())
+            return self.totals.get(heater_name, 0.0)
+
+    def get_period_watt_hours(self, period="day", heater_name=None) -> dict:
+        """ Sums the energy per day, month or year.
+
+        :param period: 'day', 'month' or 'year'
+        :param heater_name: name of a heater, None for all heaters
+        :return: dict: '2026-06-21', '2026-06' or '2026' -> Watt hours, in ascending order
+        """
+        length = {"day": 10, "month": 7, "year": 4}[period]
+        sql = "SELECT substr(day, 1, ?) AS period, SUM(watt_hours) FROM energy"
+        parameters = [length]
+        if heater_name is not None:
+            sql += " WHERE heater = ?"
+            parameters.append(heater_name)
+        sql += " GROUP BY period"
+        with self.lock:
+            result = dict(self.connection.execute(sql, parameters))
+            for (name, day), watt_hours in self.pending_energy.items():
+                if heater_name is None or name == heater_name:
+                    result[day[:length]] = result.get(day[:length], 0.0) + watt_hours
+        return dict(sorted(result.items()))
+
+    def get_current_watt_hours(self) -> dict:
+        """ Returns the energy of all heaters of today, this month and this year.
+
+            The sums are read with one query per day and then kept up to date by add_watt_hours().
+
+        :return: dict: 'today', 'month' and 'year' -> Watt hours
+        """
+        today = clock.strftime("%Y-%m-%d")
+        with self.lock:
+            if self.current_day != today:
+                row = self.connection.execute(
+                    "SELECT SUM(CASE WHEN day = ? THEN watt_hours ELSE 0 END), "
+                    "SUM(CASE WHEN substr(day, 1, 7) = ? THEN watt_hours ELSE 0 END), SUM(watt_hours) "
+                    "FROM energy WHERE substr(day, 1, 4) = ?", (today, today[:7], today[:4])).fetchone()
+                current = {"today": row[0] or 0.0, "month": row[1] or 0.0, "year": row[2] or 0.0}
+                for (name, day), watt_hours in self.pending_energy.items():
+                    for period, length in (("today", 10), ("month", 7), ("year", 4)):
+                        if day[:length] == today[:length]:
+                            current[period] += watt_hours
+                self.current_day = today
+                self.current_watt_hours = current
+            return dict(self.current_watt_hours)
+
+    def flush(self) -> None:
+        """ Writes the collected changes in one transaction and compacts the readings once a day. """
+        with self.lock:
+            if self.pending_energy or self.pending_readings:
+                with self.connection:
+                    self.connection.executemany(
+                        "INSERT INTO energy (heater, day, watt_hours) VALUES (?, ?, ?) "
+                        "ON CONFLICT (heater, day) DO UPDATE SET watt_hours = watt_hours + excluded.watt_hours",
+                        [(name, day, watt_hours) for (name, day), watt_hours in self.pending_energy.items()])
+                    self.connection.executemany("INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                                self.pending_readings)
+                self.pending_energy = {}
+                self.pending_readings = []
+            self.pending_count = 0
+            self.last_flush_time = clock.time()
+            today = clock.strftime("%Y-%m-%d")
+            if self.__get_property("compacted") != today:
+                self.compact()
+                self.__set_property("compacted", today)
+
+    def compact(self) -> None:
+        """ Replaces the readings older than raw_reading_days by hourly averages.
+
+            The limit is rounded down to a full hour, so every hour is compacted at once and
+            its row is never replaced by the rest of the hour on the next day.
+        """
+        limit = int(clock.time() - self.raw_reading_days * 86400) // 3600 * 3600
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT OR REPLACE INTO hourly_readings
+                SELECT CAST(time / 3600 AS INTEGER) * 3600 AS hour, AVG(watt_pv), AVG(watt_grid), AVG(watt_akku),
+                       AVG(charged_percent), AVG(available), AVG(step_index), COUNT(*)
+                FROM readings WHERE time < ? GROUP BY hour""", (limit,))
+            self.connection.execute("DELETE FROM readings WHERE time < ?", (limit,))
+
+    def __get_property(self, name):
+        row = self.connection.execute("SELECT value FROM properties WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def __set_property(self, name, value) -> None:
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO properties VALUES (?, ?)", (name, value))
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.flush()
+                self.connection.close()
+                self.connection = None
+
+
+# -------------------------------------------------------------------------------
+# Test
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    test_store = EnergyStore(":memory:")
+    test_store.add_watt_hours("black", 120.5)
+    test_store.add_watt_hours("white", 80)
+    test_store.add_reading(5000, -1200, -300, 55, 1500, 3)
+    print("total", test_store.get_watt_hours(), "black", test_store.get_watt_hours("black"))
+    test_store.flush()
+    test_store.add_watt_hours("black", 10)
+    print("days", test_store.get_period_watt_hours("day"))
+    print("years", test_store.get_period_watt_hours("year"))
+    test_store.close()
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+import math
+import statistics
+
+
+class Forecaster:
+    """ Predicts the available power for the next interval from the readings of the recent cycles.
+
+        Uses Holt's exponential smoothing with a damped trend for cycles at irregular intervals.
+        The spread of the one-step prediction errors is smoothed as well, so the prediction comes
+        with a band: get_quantile() assumes normally distributed errors. After a cloud edge the band
+        widens, so the manager keeps its step through a short dip and only steps down when the
+        readings stay low.
+    """
+
+    # smoothing factors of the level, the trend and the squared errors
+    alpha = 0.5
+    beta = 0.2
+    gamma = 0.3
+    # share of the trend that is extrapolated over the horizon
+    trend_damping = 0.5
+    # quantile of the predicted available power that the current step has to stay below to be kept
+    quantile = 0.9
+    # readings further apart restart the smoothing, e.g. after the idle mode
+    max_gap_seconds = 900
+
+    level = None
+    trend = 0.0
+    variance = 0.0
+    last_time = None
+
+    def update(self, time, available) -> None:
+        """ Adds the available power of a cycle.
+
+        :param time: time of the reading in seconds
+        :param available: available power in Watt
+        """
+        if self.level is None or time - self.last_time > self.max_gap_seconds or time <= self.last_time:
+            self.level = available
+            self.trend = 0.0
+            self.variance = 0.0
+            self.last_time = time
+            return
+        seconds = time - self.last_time
+        predicted = self.level + self.trend * seconds
+        error = available - predicted
+        self.variance = (1 - self.gamma) * self.variance + self.gamma * error * error
+        level = self.alpha * available + (1 - self.alpha) * predicted
+        self.trend = self.beta * (level - self.level) / seconds + (1 - self.beta) * self.trend
+        self.level = level
+        self.last_time = time
+
+    def predict(self, seconds) -> float:
+        """ Returns the available power predicted for the given seconds after the last reading. """
+        if self.level is None:
+            return 0.0
+        return self.level + self.trend * seconds * self.trend_damping
+
+    def get_deviation(self) -> float:
+        """ Returns the smoothed standard deviation of the one-step prediction errors in Watt. """
+        return math.sqrt(self.variance)
+
+    def get_quantile(self, seconds, quantile=None) -> float:
+        """ Returns the available power that is not exceeded with the probability 'quantile'.
+
+        :param seconds: seconds after the last reading
+        :param quantile: probability between 0 and 1, None for the class attribute quantile
+        :return: float: Watt
+        """
+        z = statistics.NormalDist().inv_cdf(self.quantile if quantile is None else quantile)
+        return self.predict(seconds) + z * self.get_deviation()
+
+
+# -------------------------------------------------------------------------------
+# Test
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    test_forecaster = Forecaster()
+    for test_minute, test_available in enumerate([3000, 3050, 3100, 1200, 3100, 3150, 3200, 3200, 3250, 3300]):
+        test_forecaster.update(test_minute * 60, test_available)
+        print("%4d W -> predicted %7.1f W, 10 %% quantile %7.1f W, 90 %% quantile %7.1f W" %
+              (test_available, test_forecaster.predict(60), test_forecaster.get_quantile(60, 0.1),
+               test_forecaster.get_quantile(60, 0.9)))
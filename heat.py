@@ -22,10 +22,8 @@ def heat(heater_name, heater_status=None, verbose=True):
     """
 
     if heater_name == "info":
-        text = ""
-        for heater in heaters.list:
-            text += "Status " + heater.name + ": " + heater.get_short_status() + "\n"
-        text += "%r total Watt" % total_watt()
+        heaters.update_status(refresh=False)
+        text = get_info()
         print(text)
         return text
 
@@ -47,7 +45,7 @@ def heat(heater_name, heater_status=None, verbose=True):
 
     heater_status = heater_status.lower()
 
-    status = heater.get_status_string()
+    status = heater.get_known_status_string()
     if status == "err":
         if verbose:
             print("Heater %r is ERR (may be not on the power grid)" % heater_name)
@@ -95,6 +93,18 @@ def heat(heater_name, heater_status=None, verbose=True):
         print("Heater %r is ON with %r Watt." % (heater_name, watt))
 
 
+def get_info():
+    """ Builds the short information about all heaters from their status snapshots, e.g. after update_status().
+
+    :return: str: one line per heater and the total Watt
+    """
+    text = ""
+    for heater in heaters.list:
+        text += "Status " + heater.name + ": " + heater.get_short_status() + "\n"
+    text += "%r total Watt" % total_watt()
+    return text
+
+
 def total_watt():
     watt = 0
     for heater in heaters.list:
@@ -1,6 +1,7 @@
 #!/usr/bin/python
 # coding=UTF-8
 
+import metrics
 from heat import *
 
 
@@ -17,14 +18,18 @@ class HeatStep:
     heater_name_status_list = []
     heater_names = []
     total_watt = 0
+    # list of tuples (heater name, nominal Watt) according to heaters.json and the switch_tuple
+    nominal_watt_list = []
     # a tuple of heater names, defining an exchange in the heater_status_list
     switch_tuple = None
 
     def __init__(self, heater_status_list):
         self.heater_name_status_list = heater_status_list
+        self.heater_names = []
         for heater_status in self.heater_name_status_list:
             the_name = self.__heater_name(heater_status[0])
             self.heater_names.append(the_name)
+        self.__calculate_nominal_watt_list()
         self.__calculate_total_watt(True)
 
     def __calculate_total_watt(self, according_step_definition) -> int:
@@ -33,7 +38,7 @@ class HeatStep:
         according_step_definition = True
 
         The calculation is performed according to the definition of the step.
-        But disabled and faulty heaters produce 0 Watt.
+        But disabled and faulty heaters produce 0 Watt. No heater device is requested.
 
         according_step_definition = False
 
@@ -41,22 +46,32 @@ class HeatStep:
 
         :return: int: total load in Watt
         """
+        if according_step_definition:
+            self.total_watt = self.get_nominal_total_watt(heaters.get_available_names())
+            return self.total_watt
         self.total_watt = 0
         for heater_status in self.heater_name_status_list:
             the_name = self.__heater_name(heater_status[0])
             the_load = heater_status[1]
             heater = heaters.dict[the_name]
-            if according_step_definition:
-                if heater.is_enabled():
+            try:
+                if heater.is_enabled() and heater.is_on():
                     self.total_watt += heater.get_watt_of_status(the_load)
-            else:
-                try:
-                    if heater.is_enabled() and heater.is_on():
-                        self.total_watt += heater.get_watt_of_status(the_load)
-                except ConnectException:
-                    pass
+            except ConnectException:
+                pass
         return self.total_watt
 
+    def __calculate_nominal_watt_list(self) -> None:
+        """ Looks up the nominal load in Watt of each heater of this heating level in heaters.json.
+
+        Has to be repeated whenever the switch_tuple changes. No heater device is requested.
+        """
+        self.nominal_watt_list = []
+        for heater_status in self.heater_name_status_list:
+            the_name = self.__heater_name(heater_status[0])
+            the_watt = heaters.dict[the_name].get_nominal_watt(heater_status[1])
+            self.nominal_watt_list.append((the_name, the_watt))
+
     def __heater_name(self, name) -> str:
         """ Gets the name of the heater considering a possibly defined switch_tuple.
 
@@ -91,14 +106,75 @@ class HeatStep:
             result += "[%s %4s] " % (heater_name, short_status)
         return result
 
+    def get_nominal_total_watt(self, available_names=None) -> int:
+        """ Sums the nominal load of this heating level without requesting the heater devices.
+
+        :param available_names: set of names of the heaters to be considered, None for all heaters
+        :return: int: total load in Watt
+        """
+        total_watt = 0
+        for the_name, the_watt in self.nominal_watt_list:
+            if available_names is None or the_name in available_names:
+                total_watt += the_watt
+        return total_watt
+
     def get_total_watt(self, according_step_definition) -> int:
         return self.__calculate_total_watt(according_step_definition)
 
-    def set_all_heater(self, verbose=True) -> None:
-        """ Sets the status of all heater devices according to the step definition. """
+    def get_known_total_watt(self) -> int:
+        """ Sums the current load of the heaters of this heating level from their status snapshots.
+
+        Disabled and faulty heaters produce 0 Watt. No heater device is requested.
+
+        :return: int: total load in Watt
+        """
+        total_watt = 0
         for heater_status in self.heater_name_status_list:
-            a_name, a_status = heater_status
-            heat(self.__heater_name(a_name), a_status, verbose=verbose)
+            heater = heaters.dict[self.__heater_name(heater_status[0])]
+            if heater.is_available():
+                total_watt += heater.get_known_watt() or 0
+        return total_watt
+
+    def plan_transition(self) -> dict:
+        """ Compares the known status of the heaters with this step definition.
+
+        The known status is taken from the status snapshots, so no heater device is requested.
+        Heaters already in the defined status, disabled heaters and faulty heaters are left out.
+
+        :return: dict: heater name -> status, only for heaters that have to change
+        """
+        plan = {}
+        for a_name, a_status in self.heater_name_status_list:
+            the_name = self.__heater_name(a_name)
+            heater = heater_by_name(the_name)
+            if heater.is_available() and heater.get_known_status() != a_status:
+                plan[the_name] = a_status
+        return plan
+
+    def set_all_heater(self, verbose=True) -> dict:
+        """ Sets the status of all heater devices in parallel according to the step definition.
+
+        Only heaters whose status changes are commanded, see plan_transition().
+
+        :return: dict: heater name -> None or the exception raised for this heater
+        """
+        with metrics.step_transition_seconds.time():
+            return self.__heat_all(self.plan_transition(), verbose)
+
+    def __heat_all(self, name_status_dict, verbose) -> dict:
+        """ Sends the status to the heaters in parallel and reports the failures.
+
+        :param name_status_dict: dict: heater name -> status
+        :param verbose: True or False
+        :return: dict: heater name -> None or the exception raised for this heater
+        """
+        result = heaters.for_each(lambda heater: heat(heater.name, name_status_dict[heater.name], verbose=verbose),
+                                  [heater_by_name(a_name) for a_name in name_status_dict])
+        if verbose:
+            for a_name, a_result in result.items():
+                if isinstance(a_result, Exception):
+                    print("Heater %r could not be set to %r: %r" % (a_name, name_status_dict[a_name], a_result))
+        return result
 
     def switch(self, heater_name1, heater_name2) -> str:
         """ Switches two heaters in the heat step definition to change their priority.
@@ -115,22 +191,27 @@ class HeatStep:
             raise ValueError("Unknown heater name: %r " % heater_name2)
         if not self.switch_tuple:
             self.switch_tuple = (heater_name1, heater_name2)
-            return "Heaters %r and %r are switched" % (heater_name1, heater_name2)
+            result = "Heaters %r and %r are switched" % (heater_name1, heater_name2)
         else:
             (name1, name2) = self.switch_tuple
-            if heater_name1 == name1 or heater_name1 == name2:
-                if heater_name2 == name1 or heater_name2 == name2:
-                    self.switch_tuple = None
-                    return "Heater %r and %r no longer switched" % (heater_name1, heater_name2)
-            self.switch_tuple = (heater_name1, heater_name2)
-            return "Heater %r and %r switched" % (heater_name1, heater_name2)
+            if (heater_name1 == name1 or heater_name1 == name2) and (heater_name2 == name1 or heater_name2 == name2):
+                self.switch_tuple = None
+                result = "Heater %r and %r no longer switched" % (heater_name1, heater_name2)
+            else:
+                self.switch_tuple = (heater_name1, heater_name2)
+                result = "Heater %r and %r switched" % (heater_name1, heater_name2)
+        self.__calculate_nominal_watt_list()
+        return result
 
     def clear_switch(self):
         """ Removes the switching of heaters. """
         self.switch_tuple = None
+        self.__calculate_nominal_watt_list()
 
-    def turn_off_all_heater(self):
-        """ Turns all heater off. """
-        for heater_status in self.heater_name_status_list:
-            a_name, a_status = heater_status
-            heat(self.__heater_name(a_name), "off")
+    def turn_off_all_heater(self, verbose=True) -> dict:
+        """ Turns all heater off in parallel.
+
+        :return: dict: heater name -> None or the exception raised for this heater
+        """
+        return self.__heat_all({self.__heater_name(a_name): "off"
+                                for a_name, a_status in self.heater_name_status_list}, verbose)
@@ -1,26 +1,62 @@
 #!/usr/bin/python
 # coding=UTF-8
 
+import bisect
+import collections
+import os
+import threading
+
 from heatStep import *
 from heat import *
+from stepGenerator import *
 
 
 class HeatSteps:
     """ Parses the file heatSteps.json and provides a list of HeatStep objects.
 
+        If generateSteps is True or the file does not exist, the heat steps are generated
+        from heaters.json by the StepGenerator instead.
+
+        The manager chooses from the effective steps: the steps achievable with the available heaters,
+        strictly ascending by their total load. They are rebuilt only if the availability of a heater
+        or the switching of heaters changes. Generated steps are then generated again from the
+        available heaters only, so every total of their combinations can be reached. Only their totals
+        and statuses are kept, the HeatStep object is created when the manager chooses the step.
+
         Supports the dynamic exchange of two heaters in all HeatStep objects.
     """
 
     # definition file
     heatStepsFile = "heatSteps.json"
+    generateSteps = False
 
     # list of HeatStep objects
     heatStepList = []
 
+    # effective steps with their total load, valid for effectiveKey: (available heater names, switch tuple)
+    # Generated steps are created from effectiveStatusList on demand, until then effectiveStepList holds None.
+    effectiveKey = None
+    effectiveStepList = []
+    effectiveWattList = []
+    effectiveStatusList = None
+    effectiveHeaterNames = None
+    # the last generatedStepCacheSize generated tables by effectiveKey: (total loads, statuses of the heaters),
+    # so a heater dropping out and coming back costs no generation
+    generatedStepCache = None
+    generatedStepCacheSize = 4
+    # guards the effective steps, so a reader never sees the step list of one rebuild with the totals of another
+    lock = None
+
     def __init__(self):
-        print("Parse HeatSteps ... and check connections to heaters. \n"
-              "This can take a while because TinyTuya asks several times if heaters are not connected.")
-        self.__parse(self.__read())
+        self.generatedStepCache = collections.OrderedDict()
+        self.lock = threading.RLock()
+        if self.generateSteps or not os.path.exists(self.heatStepsFile):
+            self.generateSteps = True
+            print("Generate HeatSteps ...")
+            self.__add(StepGenerator(heaters.list).generate())
+        else:
+            print("Parse HeatSteps ...")
+            self.__parse(self.__read())
 
     def __read(self):
         f = open(self.heatStepsFile, 'r')
@@ -29,7 +65,10 @@ class HeatSteps:
         return ' '.join(content)
 
     def __parse(self, content):
-        for heater_list in json.loads(content):
+        self.__add(json.loads(content))
+
+    def __add(self, step_definitions):
+        for heater_list in step_definitions:
             heat_step = HeatStep(heater_list)
             self.heatStepList.append(heat_step)
 
@@ -40,6 +79,98 @@ class HeatSteps:
     def get_list(self):
         return self.heatStepList
 
+    def __update_effective_steps(self) -> None:
+        """ Rebuilds the effective steps if the available heaters or the switching changed since the last call.
+
+        No heater device is requested. The caller holds the lock.
+        """
+        available_names = heaters.get_available_names()
+        switch_tuple = self.heatStepList[0].switch_tuple if self.heatStepList else None
+        key = (frozenset(available_names), switch_tuple)
+        if key == self.effectiveKey:
+            return
+        self.effectiveStatusList = None
+        self.effectiveHeaterNames = None
+        if not self.generateSteps:
+            self.effectiveStepList, self.effectiveWattList = self.__filter_effective_steps(available_names)
+        elif switch_tuple is None and len(available_names) == len(heaters.list):
+            # the steps generated by __init__ for all heaters
+            self.effectiveStepList = self.heatStepList
+            self.effectiveWattList = [st.get_nominal_total_watt() for st in self.heatStepList]
+        else:
+            if key in self.generatedStepCache:
+                self.generatedStepCache.move_to_end(key)
+            else:
+                self.generatedStepCache[key] = self.__generate_effective_steps(available_names, switch_tuple)
+                while len(self.generatedStepCache) > self.generatedStepCacheSize:
+                    self.generatedStepCache.popitem(last=False)
+            self.effectiveWattList, self.effectiveStatusList = self.generatedStepCache[key]
+            self.effectiveHeaterNames = [heater.name for heater in heaters.list if heater.name in available_names]
+            self.effectiveStepList = [None] * len(self.effectiveWattList)
+        self.effectiveKey = key
+
+    def __filter_effective_steps(self, available_names) -> tuple:
+        """ Drops the steps whose total load is not below the total of a higher step.
+
+            The totals of the step definition are ascending, but disabled and faulty heaters can break this
+            order or make steps collapse to the same total. Scanning from the highest step downwards keeps
+            the highest step of each total, like the manager did before.
+
+        :return: tuple (list of HeatStep objects, list of total loads in Watt), ascending
+        """
+        steps = []
+        watts = []
+        for st in reversed(self.heatStepList):
+            total = st.get_nominal_total_watt(available_names)
+            if not watts or total < watts[-1]:
+                steps.append(st)
+                watts.append(total)
+        steps.reverse()
+        watts.reverse()
+        return steps, watts
+
+    @staticmethod
+    def __generate_effective_steps(available_names, switch_tuple) -> tuple:
+        """ Generates the steps for the available heaters. The other heaters are off in every step.
+
+        :return: tuple (list of total loads in Watt, list of tuples of the status of each available heater),
+            ascending
+        """
+        available_list = [heater for heater in heaters.list if heater.name in available_names]
+        return StepGenerator(available_list, switch_tuple).generate_statuses()
+
+    def get_effective_step_count(self) -> int:
+        with self.lock:
+            self.__update_effective_steps()
+            return len(self.effectiveStepList)
+
+    def get_step_index(self, available) -> int:
+        """ Finds the highest effective heating level whose total load does not exceed the available power.
+
+        :param available: available power in Watt
+        :return: int: index of the effective heating level, 0 if no level fits
+        """
+        with self.lock:
+            self.__update_effective_steps()
+            return max(bisect.bisect_right(self.effectiveWattList, available) - 1, 0)
+
+    def get_step_watt(self, index) -> int:
+        """ Returns the total load in Watt of the effective heating level with the given index. """
+        with self.lock:
+            self.__update_effective_steps()
+            return self.effectiveWattList[min(index, len(self.effectiveWattList) - 1)]
+
+    def get_step(self, index) -> HeatStep:
+        """ Returns the effective heating level with the index given by get_step_index(). """
+        with self.lock:
+            self.__update_effective_steps()
+            index = min(index, len(self.effectiveStepList) - 1)
+            if self.effectiveStepList[index] is None:
+                statuses = dict(zip(self.effectiveHeaterNames, self.effectiveStatusList[index]))
+                self.effectiveStepList[index] = HeatStep([[heater.name, statuses.get(heater.name, "off")]
+                                                          for heater in heaters.list])
+            return self.effectiveStepList[index]
+
     def switch(self, heater_name1, heater_name2):
         result = ""
         for st in self.heatStepList:
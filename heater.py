@@ -1,9 +1,15 @@
 #!/usr/bin/python
 # coding=UTF-8
+import random
+import select
+import threading
 import time
 
 import tinytuya
 
+import metrics
+from clock import *
+
 
 class DisableException(Exception):
     """ Exception if disabled heaters are requested.
@@ -39,18 +45,45 @@ class Heater:
     loadIndex = -1
     load = {}
     isOnIndex = -1
+    # optional, heaters with a lower priority are heated first by the generated heat steps
+    priority = None
 
-    # Device.
+    # Device with a persistent socket, kept alive by heartbeats.
+    # deviceClass can be replaced by a compatible class, e.g. the virtual devices of tuyaSimulator.py.
+    deviceClass = tinytuya.OutletDevice
     heaterDevice = None
-
-    # To sum the output of the heating.
+    socketTimeoutSeconds = 5
+    socketRetryLimit = 5
+    heartbeatSeconds = 10
+    lastTrafficTime = 0
+
+    # Receive loop for DPS updates pushed by the device, e.g. after manual changes at the heater.
+    # The listeners are informed about each change of the short status.
+    receiveThread = None
+    receiveTimeoutSeconds = 1
+    listeners = None
+
+    # To sum the output of the heating. The load commanded or observed last is integrated over the
+    # monotonic time since lastChangeTime, so no device is requested.
     wattHours = 0
     lastChangeTime = None
+    integrationWatt = 0
 
-    # To detect if network errors still exist we ask only every 3 minutes.
+    # To detect if network errors still exist we ask again after an exponential backoff with jitter,
+    # starting with connectErrorRetryMinSeconds and limited to connectErrorRetryMaxSeconds.
     connectError = False
     connectErrorTime = 0
-    connectErrorRetrySeconds = 180
+    connectErrorCount = 0
+    connectErrorRetrySeconds = 0
+    connectErrorRetryMinSeconds = 10
+    connectErrorRetryMaxSeconds = 180
+
+    # Snapshot of the last status got from the device. All accessors read from this snapshot
+    # as long as it is younger than statusCacheSeconds, so one manager cycle polls each device at most once.
+    # A command renews the snapshot, a failed command drops it.
+    statusSnapshot = None
+    statusSnapshotTime = 0
+    statusCacheSeconds = 30
 
     # enabled = False  and  connectError = True  are critical values with implications for the HeatStep objects.
     # If this values change, the manager has to be informed via inform_about_new_step_definition().
@@ -59,6 +92,9 @@ class Heater:
     lastConnect = False
     dynamic_config_change = False
 
+    # Serializes the access to the device if heaters are requested in parallel.
+    lock = None
+
     def __init__(self, heater_dictionary):
         """ Initializes the Heater object without establishing a connection to the heater device.
 
@@ -72,16 +108,20 @@ class Heater:
         self.isOnIndex = heater_dictionary['isOnIndex']
         self.loadIndex = heater_dictionary['loadIndex']
         self.load = heater_dictionary['load']
+        self.priority = heater_dictionary.get('priority')
 
         self.lastEnabled = self.enabled
         self.lastConnect = False
         self.dynamic_config_change = False
+        self.lock = threading.RLock()
+        self.listeners = []
 
     def __device(self) -> tinytuya.OutletDevice:
         """ The heater device provided by TinyTuya.
 
         This device object contains all connection properties, but the connection itself follows
-        with other functions.
+        with other functions. The socket is kept open between the requests and is only closed
+        after a connection error.
 
         :returns
             tinytuya.OutletDevice: self.heaterDevice (set or updated after self.connectError)
@@ -89,13 +129,105 @@ class Heater:
             DisableException: if the heater is disabled by project configuration
         """
         if self.enabled:
-            if self.heaterDevice is None or self.connectError:
-                self.heaterDevice = tinytuya.OutletDevice(self.id, self.ip, self.key)
+            if self.heaterDevice is None:
+                self.heaterDevice = self.deviceClass(self.id, self.ip, self.key)
                 self.heaterDevice.set_version(3.3)
+                self.heaterDevice.set_socketPersistent(True)
+                self.heaterDevice.set_socketTimeout(self.socketTimeoutSeconds)
+                self.heaterDevice.set_socketRetryLimit(self.socketRetryLimit)
+            self.lastTrafficTime = clock.time()
             return self.heaterDevice
         else:
             raise DisableException
 
+    def add_listener(self, listener) -> None:
+        """ Registers a function that is called with this Heater object whenever a pushed update changes its status.
+
+        :param listener: function with a Heater object as parameter
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener) -> None:
+        """ Removes a function registered by add_listener(). Unknown functions are ignored. """
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def receive_loop(self) -> None:
+        """ Receives the DPS updates pushed by the heater device and applies them to the status snapshot.
+
+            Also keeps the persistent socket alive. Runs until stop_receiving() is called
+            or the loop is started again in another thread.
+        """
+        self.receiveThread = threading.current_thread()
+        while self.receiveThread is threading.current_thread():
+            if self.is_available() and self.heaterDevice is not None:
+                if not self.receive_update():
+                    time.sleep(self.receiveTimeoutSeconds)
+                self.keep_alive()
+            else:
+                time.sleep(self.receiveTimeoutSeconds)
+
+    def receive_update(self) -> bool:
+        """ Waits at most receiveTimeoutSeconds for a DPS update pushed by the heater device.
+
+            The waiting happens without holding the lock, so requests and commands are not delayed.
+            The lock is only taken to read the pushed data from the socket and to apply it.
+
+        :return: bool: False if the socket reported an error, otherwise True
+        """
+        device = self.heaterDevice
+        sock = getattr(device, "socket", None)
+        if sock is None:
+            # the socket is opened by the next request
+            time.sleep(self.receiveTimeoutSeconds)
+            return True
+        if not self.__is_readable(sock, self.receiveTimeoutSeconds):
+            return True
+        with self.lock:
+            # meanwhile another thread may have closed the socket or read the data
+            if device is not self.heaterDevice or device.socket is not sock or not self.__is_readable(sock, 0):
+                return True
+            # without retries TinyTuya does not reconnect while the lock is held
+            device.set_socketTimeout(self.receiveTimeoutSeconds)
+            device.set_socketRetryLimit(0)
+            try:
+                data = device.receive()
+            finally:
+                device.set_socketTimeout(self.socketTimeoutSeconds)
+                device.set_socketRetryLimit(self.socketRetryLimit)
+            if data is None:
+                return True
+            self.lastTrafficTime = clock.time()
+            if "Error" in data:
+                self.__set_connect_error()
+                self.__check_new_step_definition_by_connect(False)
+                return False
+            if "dps" in data:
+                self.__apply_pushed_dps(data["dps"])
+            return True
+
+    @staticmethod
+    def __is_readable(sock, timeout) -> bool:
+        """ Waits at most timeout seconds for data or a closed connection on the socket.
+
+        :return: bool: True if the socket can be read, False after the timeout or if the socket is closed
+        """
+        try:
+            readable, _, _ = select.select([sock], [], [], timeout)
+        except (OSError, ValueError):
+            return False
+        return len(readable) > 0
+
+    def stop_receiving(self) -> None:
+        self.receiveThread = None
+
+    def close(self) -> None:
+        """ Closes the persistent socket to the heater device. The next request opens a new one. """
+        with self.lock:
+            if self.heaterDevice is not None:
+                self.heaterDevice.close()
+                self.heaterDevice = None
+
     def get_dps(self) -> dict:
         """ Requests the DPS dictionary from the heater.
 
@@ -125,9 +257,10 @@ class Heater:
         else:
             raise ValueError("undefined load value", load_value)
 
-    def get_status_dictionary(self) -> dict:
-        """ Requests the heater status.
+    def get_status_dictionary(self, refresh=False) -> dict:
+        """ Requests the heater status or returns the status snapshot if it is not older than statusCacheSeconds.
 
+        :param refresh: bool: True to ignore the snapshot and to request the device
         :returns
             Dictionary: original status got from the heater converted to String
         :raises
@@ -141,18 +274,52 @@ class Heater:
         """
         if not self.enabled:
             raise DisableException
-        if self.connectError:
-            if (time.time() - self.connectErrorTime) < self.connectErrorRetrySeconds:
+        with self.lock:
+            if not refresh and self.statusSnapshot is not None:
+                if (clock.time() - self.statusSnapshotTime) < self.statusCacheSeconds:
+                    return self.statusSnapshot
+            if self.connectError:
+                if (clock.time() - self.connectErrorTime) < self.connectErrorRetrySeconds:
+                    self.__raise_connect_exception()
+            with metrics.heater_status_seconds.time(heater=self.name):
+                data = self.__device().status()
+            if "Error" in data:
+                self.__set_connect_error()
                 self.__raise_connect_exception()
-        data = self.__device().status()
-        if "Error" in data:
-            self.connectError = True
-            self.connectErrorTime = time.time()
-            self.__raise_connect_exception()
-        else:
-            self.connectError = False
-            self.__check_new_step_definition_by_connect(True)
-            return data
+            else:
+                self.connectError = False
+                self.connectErrorCount = 0
+                self.statusSnapshot = data
+                self.statusSnapshotTime = clock.time()
+                self.__integrate()
+                self.__check_new_step_definition_by_connect(True)
+                return data
+
+    def get_known_status(self):
+        """ Builds the short status from the status snapshot without requesting the device.
+
+        :returns
+            str: short status information like 'off', 'low', 'high'
+            None: if there is no status snapshot
+        """
+        if self.statusSnapshot is None or "dps" not in self.statusSnapshot:
+            return None
+        dps = self.statusSnapshot["dps"]
+        if not dps.get(str(self.isOnIndex), False):
+            return "off"
+        return dps.get(str(self.loadIndex))
+
+    def get_known_watt(self):
+        """ Looks up the load of the status snapshot in heaters.json without requesting the device.
+
+        :returns
+            int: load in Watt
+            None: if there is no status snapshot or its load is unknown
+        """
+        status = self.get_known_status()
+        if status == "off":
+            return 0
+        return self.load.get(status)
 
     def get_status_string(self) -> str:
         """ Requests the heater status.
@@ -171,6 +338,19 @@ class Heater:
         except ConnectException:
             return "err"
 
+    def get_known_status_string(self) -> str:
+        """ Like get_status_string(), but takes the status snapshot regardless of its age if there is one.
+            The snapshot follows the commands and the pushed updates, so no device is requested.
+
+        :returns
+            str: status converted to String, 'dis' or 'err'
+        """
+        if not self.enabled:
+            return "dis"
+        if self.statusSnapshot is None:
+            return self.get_status_string()
+        return '%r' % self.statusSnapshot
+
     def get_short_status(self) -> str:
         """ Requests the heater load and builds a very short status information.
 
@@ -224,13 +404,29 @@ class Heater:
             raise ValueError
         return self.load[status]
 
-    def get_watt_hours(self) -> int:
-        """ Returns the sum of Watt hours of this heater since existence of this object.
+    def get_nominal_watt(self, status) -> int:
+        """ Takes a status or load string and looks for the corresponding Watt value without requesting the device.
 
-        :return: int: sum of Watt hours
+        :param status: string like 'off', 'dis', 'low', 'high', ...
+        :returns
+            int: Watt value according to the definition file heaters.json
+        :raises
+            ValueError: if the heater load value is unknown in the definition file heaters.json
         """
-        self.sum_watt_hours()
-        return self.wattHours
+        if status == "off" or status == "dis":
+            return 0
+        if status not in self.load:
+            raise ValueError("undefined load value", status)
+        return self.load[status]
+
+    def get_watt_hours(self) -> float:
+        """ Returns the sum of Watt hours of this heater since existence of this object, without requesting the device.
+
+        :return: float: sum of Watt hours
+        """
+        with self.lock:
+            self.sum_watt_hours()
+            return self.wattHours
 
     def is_enabled(self) -> bool:
         """ A heater can be defined but disabled, e.g. if it is not connected to the power grid.
@@ -239,6 +435,13 @@ class Heater:
         """
         return self.enabled
 
+    def is_available(self) -> bool:
+        """ Tells without requesting the device whether the heater is enabled and was reachable at the last request.
+
+        :return: bool: True if the heater is enabled and has no connection error.
+        """
+        return self.enabled and not self.connectError
+
     def is_err(self):
         """ A heater can be in error state, e.g. if it is enabled but not connected to the power grid.
 
@@ -248,7 +451,6 @@ class Heater:
             self.get_status_dictionary()
             return False
         except ConnectException:
-            self.lastChangeTime = None
             return True
 
     def is_on(self):
@@ -260,6 +462,37 @@ class Heater:
         dps = self.get_dps()
         return dps[str(self.isOnIndex)]
 
+    def update_status(self, refresh=True) -> None:
+        """ Requests the heater device once and renews the status snapshot.
+
+            Disabled heaters and heaters with connection problems are ignored.
+
+        :param refresh: bool: False to request the device only if the snapshot is outdated
+        """
+        try:
+            self.get_status_dictionary(refresh=refresh)
+        except DisableException:
+            pass
+        except ConnectException:
+            pass
+
+    def keep_alive(self) -> None:
+        """ Sends a heartbeat to keep the persistent socket open, if there was no traffic for heartbeatSeconds.
+
+            Disabled heaters, heaters without an open socket and heaters with connection problems are ignored.
+        """
+        if not self.enabled or self.connectError or self.heaterDevice is None:
+            return
+        if (clock.time() - self.lastTrafficTime) < self.heartbeatSeconds:
+            return
+        with self.lock:
+            # The device answers a heartbeat without payload, so waiting for the answer would block the lock
+            # until the socket timeout. A dead socket shows up as a send error here or in receive_update().
+            data = self.__device().heartbeat(nowait=True)
+            if data is not None and "Error" in data:
+                self.__set_connect_error()
+                self.__check_new_step_definition_by_connect(False)
+
     def is_one_time_config_change(self):
         value = self.dynamic_config_change
         self.dynamic_config_change = False
@@ -272,12 +505,18 @@ class Heater:
 
         :param value: bool: True if the heater shall be enabled.
         """
-        self.__check_new_step_definition_by_enable(value)
-        self.enabled = value
+        with self.lock:
+            self.__check_new_step_definition_by_enable(value)
+            self.enabled = value
+            self.statusSnapshot = None
+            self.__integrate()
 
     def set_load(self, load):
         """ Sets the heater device load status.
 
+        The heater is switched on and set to the load with one command.
+        If the heater is already on, only the load is sent.
+
         :param load: string like 'off', 'low', 'high', ...
         :raises
             DisableException: if the heater is disabled
@@ -287,23 +526,37 @@ class Heater:
             raise DisableException
         if self.load is None or load not in self.load:
             raise ValueError
-        self.sum_watt_hours()
-        device = self.__device()
-        device.turn_on()
-        device.set_value(self.loadIndex, load)
-        self.lastChangeTime = time.time()
+        with self.lock, metrics.heater_set_load_seconds.time(heater=self.name):
+            device = self.__device()
+            if self.get_known_status() in self.load:
+                data = device.set_value(self.loadIndex, load)
+            else:
+                data = device.set_multiple_values({str(self.isOnIndex): True, str(self.loadIndex): load})
+            if self.__commanded(data, {str(self.isOnIndex): True, str(self.loadIndex): load}):
+                self.__integrate(self.load[load])
 
     def sum_watt_hours(self):
         """ Summarizes watt hours. This can include dynamically disabled heaters.
 
-            Updates the class properties self.wattHours and self.lastChangeTime.
+            Adds integrationWatt over the time since lastChangeTime to wattHours. No device is requested.
+            The lock keeps the receive thread and the manager from counting the same interval twice.
         """
-        if self.lastChangeTime is None:
-            return
-        hours = (time.time() - self.lastChangeTime) / 3600.0
-        watt = self.get_watt()
-        self.wattHours += watt * hours
-        self.lastChangeTime = time.time()
+        with self.lock:
+            now = clock.monotonic()
+            if self.lastChangeTime is not None:
+                self.wattHours += self.integrationWatt * (now - self.lastChangeTime) / 3600.0
+            self.lastChangeTime = now
+
+    def __integrate(self, watt=None) -> None:
+        """ Sums the watt hours up to now and continues with a new load.
+
+        :param watt: the commanded load in Watt, None to take it from the status snapshot.
+            Disabled heaters and heaters with connection problems count with 0 Watt.
+        """
+        self.sum_watt_hours()
+        if watt is None:
+            watt = self.get_known_watt()
+        self.integrationWatt = (watt or 0) if self.enabled and not self.connectError else 0
 
     def turn_on(self):
         """ Switches the heater device on.
@@ -312,9 +565,10 @@ class Heater:
             DisableException: if the heater is disabled
         """
         if self.enabled:
-            device = self.__device()
-            device.turn_on()
-            self.lastChangeTime = time.time()
+            with self.lock:
+                device = self.__device()
+                if self.__commanded(device.turn_on(), {str(self.isOnIndex): True}):
+                    self.__integrate()
         else:
             self.__raise_disable_exception()
 
@@ -325,14 +579,75 @@ class Heater:
             DisableException: if the heater is disabled
         """
         if self.enabled:
-            self.sum_watt_hours()
-            device = self.__device()
-            if device is not None:
-                device.turn_off()
-            self.lastChangeTime = None
+            with self.lock:
+                device = self.__device()
+                data = device.turn_off() if device is not None else None
+                if self.__commanded(data, {str(self.isOnIndex): False}):
+                    self.__integrate(0)
         else:
             self.__raise_disable_exception()
 
+    def __apply_pushed_dps(self, dps) -> None:
+        """ Applies pushed DPS values to the status snapshot and informs the listeners about a changed status.
+
+        :param dps: dictionary of the changed DPS values
+        """
+        if self.statusSnapshot is None:
+            return
+        before = self.get_known_status()
+        self.__update_snapshot(dps)
+        self.__integrate()
+        after = self.get_known_status()
+        if after == before:
+            return
+        for listener in self.listeners:
+            listener(self)
+
+    def __set_connect_error(self) -> None:
+        """ Marks the heater as not connected, closes the socket and calculates the next retry time.
+
+            The retry time doubles with every failed attempt. A random jitter avoids that
+            several heaters are requested again at the same moment.
+        """
+        metrics.heater_errors.inc(heater=self.name)
+        self.connectError = True
+        self.connectErrorTime = clock.time()
+        self.connectErrorCount += 1
+        backoff = min(self.connectErrorRetryMaxSeconds,
+                      self.connectErrorRetryMinSeconds * 2 ** (self.connectErrorCount - 1))
+        self.connectErrorRetrySeconds = random.uniform(backoff / 2, backoff)
+        self.statusSnapshot = None
+        self.__integrate(0)
+        self.close()
+
+    def __commanded(self, data, dps) -> bool:
+        """ Applies a command to the status snapshot and renews its time, so the following accessors
+            do not request the device again. If the device answered with an error, the snapshot is dropped
+            and the next accessor requests the device.
+
+        :param data: answer of the device to the command
+        :param dps: dictionary of the DPS values sent to the device
+        :return: bool: True if the command succeeded
+        """
+        if data is not None and "Error" in data:
+            self.statusSnapshot = None
+            self.__integrate()
+            return False
+        self.__update_snapshot(dps)
+        self.statusSnapshotTime = clock.time()
+        return True
+
+    def __update_snapshot(self, dps) -> None:
+        """ Applies the values sent to the device to the status snapshot, so no new request is needed.
+
+        :param dps: dictionary of the changed DPS values
+        """
+        if self.statusSnapshot is None or "dps" not in self.statusSnapshot:
+            return
+        new_dps = dict(self.statusSnapshot["dps"])
+        new_dps.update(dps)
+        self.statusSnapshot = dict(self.statusSnapshot, dps=new_dps)
+
     def __check_new_step_definition_by_enable(self, is_enabled):
         if not self.dynamic_config_change:
             if is_enabled != self.lastEnabled:
@@ -1,7 +1,12 @@
 #!/usr/bin/python
 # coding=UTF-8 
 
+import concurrent.futures
 import json
+import math
+import time
+import metrics
+from energyStore import *
 from heater import *
 
 
@@ -13,6 +18,21 @@ class Heaters:
     heatersFile = "heaters.json"
     list = []
     dict = {}
+
+    # Bounded thread pool to request and command all heaters in parallel.
+    # Each call may take deviceTimeoutSeconds, longer than TinyTuya needs for all its connection retries,
+    # so a call given up by for_each() has ended before the next cycle takes the heater lock again.
+    maxWorkers = 8
+    deviceTimeoutSeconds = Heater.socketTimeoutSeconds * (Heater.socketRetryLimit + 1) + 5
+    executor = None
+
+    receiveThreads = None
+
+    # Optional persistent store of the energy, opened by open_energy_store().
+    energyStoreFile = "energy.sqlite"
+    energyStore = None
+    # heater name -> Heater.wattHours already added to the store
+    storedWattHours = None
     
     def __init__(self):
         self.__parse(self.__read())
@@ -34,14 +54,158 @@ class Heaters:
 
         :return: int: total electrical power
         """
+        if self.energyStore is not None:
+            self.store_watt_hours()
+            return self.energyStore.get_watt_hours()
         total_watt_hours = 0
         for heater in self.list:
             total_watt_hours += heater.get_watt_hours()
         return total_watt_hours
 
+    def store_watt_hours(self) -> None:
+        """ Adds the Watt hours of each heater since the last call to the energy store, if it is open. """
+        if self.energyStore is None:
+            return
+        for heater in self.list:
+            watt_hours = heater.get_watt_hours()
+            self.energyStore.add_watt_hours(heater.name, watt_hours - self.storedWattHours[heater.name])
+            self.storedWattHours[heater.name] = watt_hours
+
+    def open_energy_store(self, path=None) -> EnergyStore:
+        """ Opens the persistent energy store and continues the Watt hours of each heater from the stored values.
+
+        :param path: SQLite file, by default energyStoreFile
+        :return: EnergyStore
+        """
+        self.energyStore = EnergyStore(path or self.energyStoreFile)
+        self.storedWattHours = {}
+        for heater in self.list:
+            heater.wattHours = self.energyStore.get_watt_hours(heater.name)
+            self.storedWattHours[heater.name] = heater.wattHours
+        return self.energyStore
+
+    def __executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if Heaters.executor is None:
+            Heaters.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.maxWorkers,
+                                                                     thread_name_prefix="heater")
+        return Heaters.executor
+
+    def for_each(self, function, heater_list=None) -> dict:
+        """ Calls a function for several heaters in parallel and collects the results.
+
+        Each call is waited for at most deviceTimeoutSeconds from its start in the thread pool, so a call
+        waiting for a free worker is not cut short. A heater that does not answer in time does not delay
+        the others. Its call continues in the background and is counted in metrics.heater_timeouts.
+
+        :param function: function with a Heater object as parameter
+        :param heater_list: list of Heater objects, None for all heaters
+        :return: dict: heater name -> result of the function or the exception raised by it,
+                 concurrent.futures.TimeoutError if the heater did not answer in time
+        """
+        if heater_list is None:
+            heater_list = self.list
+        if len(heater_list) == 0:
+            return {}
+        # heater name -> start of its call in the thread pool
+        starts = {}
+
+        def call(heater):
+            starts[heater.name] = time.monotonic()
+            return function(heater)
+
+        futures = {self.__executor().submit(call, heater): heater for heater in heater_list}
+        # a limit for all calls, in case the calls ahead of a waiting one do not end
+        rounds = math.ceil(len(heater_list) / self.maxWorkers)
+        end = time.monotonic() + self.deviceTimeoutSeconds * (rounds + 1)
+        not_done = set(futures)
+        while not_done:
+            now = time.monotonic()
+            deadlines = {future: starts[futures[future].name] + self.deviceTimeoutSeconds
+                         for future in not_done if futures[future].name in starts}
+            waiting = {future for future in not_done if deadlines.get(future, end) > now}
+            if not waiting or now >= end:
+                break
+            timeout = min(min(deadlines.get(future, end) for future in waiting), end) - now
+            done, _ = concurrent.futures.wait(waiting, timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            not_done -= done
+        result = {}
+        for future, heater in futures.items():
+            if not future.done():
+                metrics.heater_timeouts.inc(heater=heater.name)
+                print("Heater %r did not answer within %g s" % (heater.name, self.deviceTimeoutSeconds))
+                result[heater.name] = concurrent.futures.TimeoutError("Heater %r did not answer in time" % heater.name)
+            elif future.exception() is not None:
+                result[heater.name] = future.exception()
+            else:
+                result[heater.name] = future.result()
+        return result
+
+    def get_available_names(self) -> set:
+        """ Returns the names of all enabled heaters without connection errors. No device is requested.
+
+        :return: set: heater names
+        """
+        return {heater.name for heater in self.list if heater.is_available()}
+
     def get_total_watt_hours(self):
         return self.__calculate_total_watt_hours()
 
+    def add_listener(self, listener) -> None:
+        """ Registers a function that is called with the Heater object whenever a pushed update changes its status.
+
+        :param listener: function with a Heater object as parameter
+        """
+        for heater in self.list:
+            heater.add_listener(listener)
+
+    def remove_listener(self, listener) -> None:
+        """ Removes a function registered by add_listener() from all heaters. """
+        for heater in self.list:
+            heater.remove_listener(listener)
+
+    def start_receiving(self) -> None:
+        """ Starts one background thread per heater receiving pushed updates and keeping the socket alive. """
+        if self.receiveThreads is not None:
+            return
+        self.receiveThreads = []
+        for heater in self.list:
+            thread = threading.Thread(target=heater.receive_loop, name="receive-" + heater.name, daemon=True)
+            self.receiveThreads.append(thread)
+            thread.start()
+
+    def is_all_off(self) -> bool:
+        """ Tells from the status snapshots whether no heater is on. No device is requested.
+
+        :return: bool: True if no heater is known to be on
+        """
+        for heater in self.list:
+            if heater.get_known_status() not in (None, "off"):
+                return False
+        return True
+
+    def stop_receiving(self) -> None:
+        """ Stops the receive threads started by start_receiving(). """
+        if self.receiveThreads is None:
+            return
+        for heater in self.list:
+            heater.stop_receiving()
+        self.receiveThreads = None
+
+    def close(self) -> None:
+        """ Closes the persistent sockets of all heaters and writes the collected changes of the energy store. """
+        for heater in self.list:
+            heater.close()
+        if self.energyStore is not None:
+            self.energyStore.flush()
+
+    def update_status(self, refresh=True) -> None:
+        """ Requests the status of every heater once in parallel and renews their status snapshots.
+
+        :param refresh: bool: False to request only heaters with an outdated snapshot
+        """
+        self.for_each(lambda heater: heater.update_status(refresh))
+
     def is_dynamic_configuration_change(self):
         for heater in self.list:
             if heater.is_one_time_config_change():
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+import array
+import math
+import threading
+
+
+class RingBuffer:
+    """ Fixed number of rows with float columns, each column an array of doubles.
+
+        When the buffer is full, a new row overwrites the oldest one, so the memory never grows.
+    """
+
+    def __init__(self, columns, capacity):
+        """ Allocates the buffer.
+
+        :param columns: list of column names, the first one has to be the time in ascending order
+        :param capacity: maximum number of rows
+        """
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.data = [array.array('d', bytes(8 * capacity)) for _ in self.columns]
+        # index of the next row to be written and number of rows
+        self.head = 0
+        self.count = 0
+
+    def append(self, values) -> None:
+        """ Appends a row with one value per column. """
+        for column, value in zip(self.data, values):
+            column[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def get_rows(self, start=None, end=None) -> list:
+        """ Returns the rows with start <= time < end in ascending order of time.
+
+        :param start: time in seconds since the epoch, None for the oldest row
+        :param end: time in seconds since the epoch, None for the newest row
+        :return: list of lists of floats
+        """
+        first = (self.head - self.count) % self.capacity
+        times = self.data[0]
+        rows = []
+        for i in range(self.count):
+            index = (first + i) % self.capacity
+            if (start is None or times[index] >= start) and (end is None or times[index] < end):
+                rows.append([column[index] for column in self.data])
+        return rows
+
+
+class Rollup:
+    """ Averages of the values and sums of the energies per interval of 'resolution' seconds. """
+
+    def __init__(self, value_columns, energy_columns, resolution, capacity):
+        self.value_columns = value_columns
+        self.energy_columns = energy_columns
+        self.resolution = resolution
+        self.buffer = RingBuffer(["time"] + value_columns + energy_columns + ["count"], capacity)
+        # the interval being collected: start time, sums of the values, sums of the energies, number of samples
+        self.bucket_time = None
+        self.value_sums = [0.0] * len(value_columns)
+        self.energy_sums = [0.0] * len(energy_columns)
+        self.bucket_count = 0
+
+    def add(self, time, values, energies) -> None:
+        bucket_time = math.floor(time / self.resolution) * self.resolution
+        if bucket_time != self.bucket_time:
+            if self.bucket_count > 0:
+                self.buffer.append(self.__get_bucket_row())
+            self.bucket_time = bucket_time
+            self.value_sums = [0.0] * len(self.value_columns)
+            self.energy_sums = [0.0] * len(self.energy_columns)
+            self.bucket_count = 0
+        self.value_sums = [s + v for s, v in zip(self.value_sums, values)]
+        self.energy_sums = [s + e for s, e in zip(self.energy_sums, energies)]
+        self.bucket_count += 1
+
+    def __get_bucket_row(self) -> list:
+        return ([self.bucket_time] + [s / self.bucket_count for s in self.value_sums] + self.energy_sums +
+                [self.bucket_count])
+
+    def get_rows(self, start=None, end=None) -> list:
+        """ Returns the finished intervals and the current one, see RingBuffer.get_rows(). """
+        rows = self.buffer.get_rows(start, end)
+        if self.bucket_count > 0 and (start is None or self.bucket_time >= start) and \
+                (end is None or self.bucket_time < end):
+            rows.append(self.__get_bucket_row())
+        return rows
+
+
+class History:
+    """ In-memory history of the manager cycles with a fixed size.
+
+        Each cycle adds the readings of the solar system, the available power, the heat step and the
+        load of each heater. The raw samples are kept in a ring buffer and rolled up to averages
+        per minute, per 15 minutes and per hour. The rollups also sum the energies between two
+        samples, e.g. heated_exporting_wh is the energy heated while power went into the grid.
+    """
+
+    # resolution name -> (seconds, number of intervals kept)
+    resolutions = {"1m": (60, 1440), "15m": (900, 4 * 24 * 14), "1h": (3600, 24 * 180)}
+    raw_capacity = 4096
+    # samples further apart are not integrated, e.g. after a restart or in the idle mode
+    max_gap_seconds = 900
+
+    base_columns = ["watt_pv", "watt_grid", "watt_akku", "charged_percent", "available", "step_index",
+                    "heater_watt"]
+    energy_columns = ["pv_wh", "heated_wh", "heated_exporting_wh", "export_wh", "import_wh"]
+
+    def __init__(self, heater_names):
+        """ Allocates the buffers.
+
+        :param heater_names: list of names of the heaters, each gets a column with its load in Watt
+        """
+        self.heater_names = list(heater_names)
+        self.value_columns = self.base_columns + ["watt_" + name for name in self.heater_names]
+        self.raw = RingBuffer(["time"] + self.value_columns, self.raw_capacity)
+        self.rollups = {name: Rollup(self.value_columns, self.energy_columns, seconds, capacity)
+                        for name, (seconds, capacity) in self.resolutions.items()}
+        self.last_time = None
+        # powers of the last sample, integrated over the interval up to the next sample
+        self.last_powers = None
+        self.lock = threading.Lock()
+
+    def add(self, time, watt_pv, watt_grid, watt_akku, charged_percent, available, step_index, heater_watts) -> None:
+        """ Adds the readings of a cycle. The interval since the last sample is integrated with the powers of
+            the last sample, which were valid until this cycle changed them. Samples not after the last one
+            are ignored, e.g. a cycle that failed and left its time unchanged.
+
+        :param time: time of the cycle in seconds since the epoch
+        :param heater_watts: dict: heater name -> current load in Watt
+        """
+        heater_values = [heater_watts.get(name) or 0 for name in self.heater_names]
+        heater_watt = sum(heater_values)
+        values = [watt_pv, watt_grid, watt_akku, charged_percent, available, step_index, heater_watt] + heater_values
+        with self.lock:
+            if self.last_time is not None and time <= self.last_time:
+                return
+            hours = 0.0
+            if self.last_time is not None and time - self.last_time <= self.max_gap_seconds:
+                hours = (time - self.last_time) / 3600.0
+            last_pv, last_grid, last_heater = self.last_powers or (0, 0, 0)
+            self.last_time = time
+            self.last_powers = (watt_pv, watt_grid, heater_watt)
+            energies = [last_pv * hours,
+                        last_heater * hours,
+                        last_heater * hours if last_grid < 0 else 0.0,
+                        max(-last_grid, 0) * hours,
+                        max(last_grid, 0) * hours]
+            self.raw.append([time] + values)
+            for rollup in self.rollups.values():
+                rollup.add(time, values, energies)
+
+    def query(self, resolution="15m", start=None, end=None) -> dict:
+        """ Returns the history between start and end.
+
+        :param resolution: 'raw', '1m', '15m' or '1h'
+        :param start: time in seconds since the epoch, None for the oldest entry
+        :param end: time in seconds since the epoch, None for the newest entry
+        :return: dict with 'columns', 'rows' and for rollups 'totals' of the energy columns
+        :raises
+            ValueError: if the resolution is unknown
+        """
+        with self.lock:
+            if resolution == "raw":
+                return {"resolution": resolution, "columns": self.raw.columns,
+                        "rows": self.raw.get_rows(start, end)}
+            if resolution not in self.rollups:
+                raise ValueError("Unknown resolution %r" % resolution)
+            rollup = self.rollups[resolution]
+            rows = rollup.get_rows(start, end)
+        columns = rollup.buffer.columns
+        first_energy = columns.index(self.energy_columns[0])
+        totals = {name: sum(row[first_energy + i] for row in rows) for i, name in enumerate(self.energy_columns)}
+        return {"resolution": resolution, "columns": columns, "rows": rows, "totals": totals}
+
+
+# -------------------------------------------------------------------------------
+# Test
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    test_history = History(["black", "white"])
+    for test_minute in range(0, 180, 2):
+        test_history.add(test_minute * 60.0, 3000, -500 if test_minute < 90 else 200, 0, 50, 1000, 2,
+                         {"black": 1500, "white": 500})
+    test_result = test_history.query("1h")
+    print(test_result["columns"])
+    for test_row in test_result["rows"]:
+        print(test_row)
+    print(test_result["totals"])
@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+# coding=UTF-8
+import concurrent.futures
+
+import requests
+
+
+class InverterBackend:
+    """ Reads the realtime data of a power inverter for the class Solar.
+
+        A backend for another inverter implements read(). The power flows follow the signs of the
+        Fronius Solar API V1: watt_grid and watt_akku are negative to the grid or the accumulator,
+        watt_load is negative if energy is consumed.
+    """
+
+    def read(self) -> dict:
+        """ Requests the realtime data from the inverter.
+
+        :return: dict with watt_pv, watt_load, watt_akku, watt_grid and charged_percent
+        :raises
+            Exception: if the inverter cannot be reached or answers with an error
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """ Closes the connections to the inverter, the next read() opens them again. """
+        pass
+
+
+class FroniusBackend(InverterBackend):
+    """ Requests the Fronius Solar API V1 via HTTP.
+
+        Power flow and state of charge are two JSON requests, which run in parallel.
+    """
+
+    # to request the power flow to (-) or from (+) the grid, accumulator and devices
+    watt_path = "/solar_api/v1/GetPowerFlowRealtimeData.fcgi"
+    # to request the state of charge of the accumulator
+    akku_path = "/solar_api/v1/GetStorageRealtimeData.cgi"
+    # timeouts in seconds to connect to and to read from the inverter
+    connect_timeout_seconds = 3.05
+    read_timeout_seconds = 10
+
+    # HTTP session keeping the connections to the inverter alive, both requests run in parallel
+    session = None
+    executor = None
+
+    def __init__(self, base_url):
+        """ Initializes the connection to the inverter.
+
+        :param base_url: URL of the inverter, e.g. "http://192.168.178.69"
+        """
+        self.base_url = base_url
+        self.watt_url = base_url + self.watt_path
+        self.akku_url = base_url + self.akku_path
+        self.session = requests.Session()
+        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="solar")
+
+    def read(self) -> dict:
+        """ Requests power flow and state of charge in parallel.
+
+        :raises
+            requests.RequestException: if the inverter cannot be reached or does not answer in time
+        """
+        watt_future = self.executor.submit(self.__request, self.watt_url)
+        akku_future = self.executor.submit(self.__request, self.akku_url)
+        site = watt_future.result()["Body"]["Data"]["Site"]
+        controller = akku_future.result()["Body"]["Data"]["0"]["Controller"]
+        return {"watt_pv": site["P_PV"],
+                "watt_load": site["P_Load"],
+                "watt_akku": site["P_Akku"],
+                "watt_grid": site["P_Grid"],
+                "charged_percent": controller["StateOfCharge_Relative"]}
+
+    def __request(self, url) -> dict:
+        r = self.session.get(url, timeout=(self.connect_timeout_seconds, self.read_timeout_seconds))
+        try:
+            return r.json()
+        finally:
+            r.close()
+
+    def close(self) -> None:
+        self.session.close()
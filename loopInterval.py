@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+
+class LoopInterval:
+    """ Adapts the time between two manager cycles to the volatility of the available power.
+
+        The interval is shortened if 'available' changes fast, e.g. under passing clouds.
+        It is lengthened step by step if the readings are stable, and set to the maximum
+        if there is no photovoltaic production, e.g. at night.
+    """
+
+    min_seconds = 15
+    max_seconds = 300
+    # the current interval
+    seconds = 60
+
+    # changes of 'available' between two cycles up to stable_watt lengthen the interval,
+    # changes of at least volatile_watt lead to the minimum interval
+    stable_watt = 100
+    volatile_watt = 500
+    # factor to lengthen or shorten the interval per cycle
+    factor = 1.5
+    # photovoltaic production in Watt below which the maximum interval is used
+    night_pv_watt = 10
+
+    last_available = None
+
+    def __init__(self, min_seconds, max_seconds, seconds):
+        """ Initializes the interval.
+
+        :param min_seconds: lower bound of the interval in seconds
+        :param max_seconds: upper bound of the interval in seconds
+        :param seconds: interval in seconds to start with
+        """
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.seconds = min(max(seconds, min_seconds), max_seconds)
+        self.last_available = None
+
+    def update(self, available, watt_pv) -> float:
+        """ Calculates the interval until the next cycle from the latest readings.
+
+        :param available: available power in Watt
+        :param watt_pv: current photovoltaic production in Watt
+        :return: float: interval in seconds
+        """
+        if watt_pv < self.night_pv_watt:
+            self.seconds = self.max_seconds
+        elif self.last_available is not None:
+            change = abs(available - self.last_available)
+            if change >= self.volatile_watt:
+                self.seconds = self.min_seconds
+            elif change <= self.stable_watt:
+                self.seconds = min(self.seconds * self.factor, self.max_seconds)
+            else:
+                self.seconds = max(self.seconds / self.factor, self.min_seconds)
+        self.last_available = available
+        return self.seconds
+
+    def get_seconds(self) -> float:
+        return self.seconds
+
+
+# -------------------------------------------------------------------------------
+# Test
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    test_interval = LoopInterval(15, 300, 60)
+    for test_available, test_pv in [(1000, 3000), (1050, 3000), (1020, 3000), (1800, 3000), (1500, 3000), (0, 0)]:
+        print(test_available, test_pv, test_interval.update(test_available, test_pv))
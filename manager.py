@@ -1,15 +1,22 @@
 #!/usr/bin/python3
 # coding=UTF-8
 
+import json
+import queue
 import threading
+import metrics
 from heatSteps import *
+from history import *
+from forecaster import *
+from modulator import *
+from loopInterval import *
 from solar import *
 
 heatSteps = HeatSteps()
 
 
 def get_time_string():
-    return time.strftime("%d.%m.%y %H:%M")
+    return clock.strftime("%d.%m.%y %H:%M")
 
 
 class HeatManager(threading.Thread):
@@ -20,6 +27,12 @@ class HeatManager(threading.Thread):
 
     loop_time_seconds = 60
     tolerated_akku_grid_usage_in_watt = 30
+    # cycles of __try_loop() to stay on a lower step after too much power was taken from the akku or grid
+    sticky_cycles = 5
+    # bounds of the adaptive interval of __measure_loop(), starting with loop_time_seconds
+    min_loop_time_seconds = 15
+    max_loop_time_seconds = 300
+    loop_interval = None
 
     solar = None
     heatStepList = None
@@ -30,12 +43,67 @@ class HeatManager(threading.Thread):
     step = None
     dynamic_config_change = False
 
-    status_print = ""
+    # set by pushed heater updates to start the next cycle before loop_time_seconds are over
+    wake_event = None
+
+    # Idle mode, e.g. at night: if the photovoltaic production stays below idle_pv_watt for idle_cycles
+    # and all heaters are off, the heaters are no longer requested and the inverter is only requested
+    # every idle_loop_time_seconds, until the production returns.
+    idle = False
+    idle_count = 0
+    idle_pv_watt = 50
+    idle_cycles = 5
+    idle_loop_time_seconds = 900
 
-    def __init__(self):
+    # published by each cycle, so the HeatServer can answer without requesting any device
+    status_print = ""
+    info_print = ""
+    # time of the last published cycle in seconds since the epoch
+    cycle_time = None
+    available = 0
+    # number of steps the last cycle chose from, so the status document does not rebuild the effective steps
+    step_count = 0
+
+    # queues of the clients of the event stream, each receives (id, event, JSON data) per cycle and step change
+    subscribers = None
+    subscribers_lock = None
+    subscriber_queue_size = 100
+    event_id = 0
+
+    # readings and heater loads of the cycles with rollups, for the history query of the HeatServer
+    history = None
+
+    # Modulation mode of __measure_loop(): if 'available' lies between two steps, the manager alternates
+    # between them within modulation_window_seconds, keeping each step at least modulation_min_dwell_seconds.
+    modulation = False
+    modulation_window_seconds = 600
+    modulation_min_dwell_seconds = 120
+    modulator = None
+
+    # Forecasting mode of __measure_loop(): a step up follows the available power at once, a step down waits
+    # while the current step stays below Forecaster.quantile of the available power predicted for the next
+    # interval. So a short dip under a passing cloud is bridged instead of switching twice.
+    forecasting = False
+    forecaster = None
+    # total Watt of the step chosen before the modulation, mapped to the current effective steps in each cycle
+    base_step_watt = 0
+
+    def __init__(self, solar=None):
+        """ Initializes the manager without starting it.
+
+        :param solar: Solar object, None to request the inverter configured in the class Solar
+        """
         super().__init__()
-        self.solar = Solar()
+        self.solar = Solar() if solar is None else solar
         self.heatStepList = heatSteps.heatStepList
+        self.loop_interval = LoopInterval(self.min_loop_time_seconds, self.max_loop_time_seconds,
+                                          self.loop_time_seconds)
+        self.wake_event = threading.Event()
+        self.subscribers = []
+        self.subscribers_lock = threading.Lock()
+        self.history = History([heater.name for heater in heaters.list])
+        self.modulator = Modulator(self.modulation_window_seconds, self.modulation_min_dwell_seconds)
+        self.forecaster = Forecaster()
 
     def is_running(self):
         return self.running
@@ -45,99 +113,339 @@ class HeatManager(threading.Thread):
             return
         self.running = True
         # wait a few seconds - let the HeatServer lead
-        time.sleep(5)
+        clock.sleep(5)
         print(get_time_string() + " Manager is started!")
-        if self.solar.is_supply_to_grid():
-            self.__measure_loop()
-        else:
-            self.__try_loop()
+        # registered only while running, so a finished manager, e.g. of a simulation, is not woken up
+        heaters.add_listener(self.__wake_up)
+        try:
+            heaters.start_receiving()
+            if self.solar.is_supply_to_grid():
+                self.__measure_loop()
+            else:
+                self.__try_loop()
+        finally:
+            heaters.remove_listener(self.__wake_up)
 
     def set_verbose(self, verbose):
         self.verbose = verbose
 
     def __start_try_loop(self):
         """ Sets the highest possible HeatStep """
+        self.step_count = len(self.heatStepList)
         for index in range(0, len(self.heatStepList)):
             self.step = self.heatStepList[index]
             self.solar.update()
             akku_grid = self.solar.get_watt_akku_grid()
-            print("AKKU+GRID:", akku_grid)
+            if self.verbose:
+                print("AKKU+GRID:", akku_grid)
             if akku_grid < self.tolerated_akku_grid_usage_in_watt:
-                self.step.set_all_heater()
+                self.step.set_all_heater(self.verbose)
                 self.heatStepIndex = index
-                time.sleep(self.loop_time_seconds)
+                self.__sleep(self.loop_time_seconds)
 
     def __try_loop(self):
         """ Sets and updates to the highest possible HeatStep """
         self.__start_try_loop()
         sticky_count = 0
         while self.running:
-            now = get_time_string()
-            self.solar.update()
-            akku_grid = self.solar.get_watt_akku_grid()
-            print(now, "AKKU+GRID", akku_grid, "  ", self.step.get_all_heater_status_tuple_as_string())
-            if akku_grid > self.tolerated_akku_grid_usage_in_watt:  # parameter
-                if self.heatStepIndex > 0:
-                    self.heatStepIndex -= 1
-                    self.step = self.heatStepList[self.heatStepIndex]
-                    self.step.set_all_heater()
-                    self.stickyStepIndex = self.heatStepIndex
-                    sticky_count = 5  # parameter
-            else:
-                if sticky_count > 0:
-                    sticky_count -= 1
-                else:
-                    if self.heatStepIndex < len(self.heatStepList) - 1:
-                        self.heatStepIndex += 1
+            with metrics.cycle_seconds.time():
+                now = get_time_string()
+                heaters.update_status()
+                self.solar.update()
+                akku_grid = self.solar.get_watt_akku_grid()
+                self.available = self.__publish_status(self.loop_time_seconds)
+                self.__store_cycle(self.available)
+                metrics.available_watts.set(self.available)
+                self.info_print = get_info()
+                if self.verbose:
+                    print(now, "AKKU+GRID", akku_grid, "  ", self.step.get_all_heater_status_tuple_as_string())
+                if akku_grid > self.tolerated_akku_grid_usage_in_watt:
+                    if self.heatStepIndex > 0:
+                        self.heatStepIndex -= 1
                         self.step = self.heatStepList[self.heatStepIndex]
-                        self.step.set_all_heater()
-            time.sleep(self.loop_time_seconds)
+                        self.step.set_all_heater(self.verbose)
+                        self.__publish_step_change(self.heatStepIndex + 1)
+                        self.stickyStepIndex = self.heatStepIndex
+                        sticky_count = self.sticky_cycles
+                else:
+                    if sticky_count > 0:
+                        sticky_count -= 1
+                    else:
+                        if self.heatStepIndex < len(self.heatStepList) - 1:
+                            self.heatStepIndex += 1
+                            self.step = self.heatStepList[self.heatStepIndex]
+                            self.step.set_all_heater(self.verbose)
+                            self.__publish_step_change(self.heatStepIndex - 1)
+                self.cycle_time = clock.time()
+            self.__add_history()
+            self.__update_metrics()
+            self.__publish("cycle", self.get_status_document())
+            self.__sleep(self.loop_time_seconds)
 
     def __measure_loop(self):
         self.step = self.heatStepList[0]
         self.step.set_all_heater(verbose=self.verbose)
         while self.running:
             try:
-                # 'available' takes into account the current availability of the heaters
-                #
-                # If some heaters are temporarily unavailable, a high heat setting can be selected
-                # with the remaining heaters. If the heaters are available again, this change must
-                # lead to a recalculation of the heating level. The suddenly high value of 'available'
-                # does not reflect the real power use.
-                available = self.__get_status_and_available()
-                if not self.dynamic_config_change:
-                    self.dynamic_config_change = heaters.is_dynamic_configuration_change()
-                cs = "  CS" if self.dynamic_config_change else ""
-                if self.verbose:
-                    print(self.status_print + cs)
-                i = len(self.heatStepList)
-                for st in reversed(self.heatStepList):
-                    i -= 1
-                    # print(st.heater_status_list)
-                    total_watt = st.get_total_watt(True)
-                    # print("TOTAL", total_watt)
-                    if available >= total_watt or i == 0:
-                        if st != self.step or self.dynamic_config_change:
-                            self.dynamic_config_change = False
-                            st.set_all_heater(self.verbose)
-                            self.step = st
-                        break
-                time.sleep(self.loop_time_seconds)
+                with metrics.cycle_seconds.time():
+                    if self.idle:
+                        self.__idle_cycle()
+                    else:
+                        self.__measure_cycle()
+                        self.__check_idle()
             except Exception:
-                pass
-        self.step.turn_off_all_heater()
+                # e.g. the inverter did not answer in time, try again in the next cycle
+                metrics.cycle_errors.inc()
+            self.__add_history()
+            self.__update_metrics()
+            self.__publish("cycle", self.get_status_document())
+            self.__sleep_and_modulate(self.idle_loop_time_seconds if self.idle else self.loop_interval.get_seconds())
+        self.step.turn_off_all_heater(self.verbose)
+        heaters.stop_receiving()
+        heaters.close()
+        self.solar.close()
         print("Manager is stopped and all Heaters are OFF!")
 
+    def __measure_cycle(self):
+        # 'available' takes into account the current availability of the heaters
+        #
+        # If some heaters are temporarily unavailable, a high heat setting can be selected
+        # with the remaining heaters. If the heaters are available again, this change must
+        # lead to a recalculation of the heating level. The suddenly high value of 'available'
+        # does not reflect the real power use.
+        #
+        # Each heater is requested once per cycle, all further accesses use the status snapshot.
+        heaters.update_status()
+        available = self.__get_status_and_available()
+        self.info_print = get_info()
+        self.cycle_time = clock.time()
+        self.available = available
+        self.loop_interval.update(available, self.solar.get_watt_pv())
+        if not self.dynamic_config_change:
+            self.dynamic_config_change = heaters.is_dynamic_configuration_change()
+        cs = "  CS" if self.dynamic_config_change else ""
+        if self.verbose:
+            print(self.status_print + cs)
+        previous_index = self.heatStepIndex
+        if self.forecasting:
+            self.heatStepIndex = self.__choose_forecast_step(available)
+        else:
+            self.heatStepIndex = heatSteps.get_step_index(available)
+        self.base_step_watt = heatSteps.get_step_watt(self.heatStepIndex)
+        self.step_count = heatSteps.get_effective_step_count()
+        if self.modulation and self.heatStepIndex + 1 < self.step_count:
+            lower_watt = heatSteps.get_step_watt(self.heatStepIndex)
+            upper_watt = heatSteps.get_step_watt(self.heatStepIndex + 1)
+            self.heatStepIndex = self.modulator.update(clock.time(), self.heatStepIndex,
+                                                       (available - lower_watt) / (upper_watt - lower_watt))
+        else:
+            # no upper step, e.g. available reaches the top step: nothing to alternate until the next cycle
+            self.modulator.reset()
+        self.__store_cycle(available)
+        metrics.available_watts.set(available)
+        st = heatSteps.get_step(self.heatStepIndex)
+        if st != self.step or self.dynamic_config_change:
+            self.dynamic_config_change = False
+            st.set_all_heater(self.verbose)
+            if st != self.step:
+                self.step = st
+                self.__publish_step_change(previous_index)
+
+    def __choose_forecast_step(self, available):
+        """ Chooses the step with the forecaster: up as soon as available reaches a higher step, down only
+            if the current step lies above Forecaster.quantile of the prediction for the next interval.
+
+            The current step is taken by its total Watt, so it stays valid if the effective steps are rebuilt.
+
+        :return: int: index of the effective step
+        """
+        self.forecaster.update(clock.time(), available)
+        index = heatSteps.get_step_index(available)
+        current = heatSteps.get_step_index(self.base_step_watt)
+        if index < current and \
+                heatSteps.get_step_watt(current) <= self.forecaster.get_quantile(self.loop_interval.get_seconds()):
+            return current
+        return index
+
+    def cycle(self):
+        """ Runs one cycle of the measure loop without waiting, e.g. for benchmarks.
+
+            Before the first cycle, the lowest heat step is set like at the start of __measure_loop().
+        """
+        if self.step is None:
+            self.step = self.heatStepList[0]
+            self.step.set_all_heater(verbose=self.verbose)
+        with metrics.cycle_seconds.time():
+            self.__measure_cycle()
+        self.__update_metrics()
+        self.__publish("cycle", self.get_status_document())
+
+    def subscribe(self) -> queue.Queue:
+        """ Registers a client of the event stream.
+
+        :return: queue.Queue receiving a tuple (id, event, JSON data) for each cycle and each step change
+        """
+        events = queue.Queue(self.subscriber_queue_size)
+        with self.subscribers_lock:
+            self.subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events) -> None:
+        with self.subscribers_lock:
+            if events in self.subscribers:
+                self.subscribers.remove(events)
+
+    def __publish(self, event, data) -> None:
+        """ Sends an event to all subscribers. The data is serialized once. A slow client loses its oldest events. """
+        with self.subscribers_lock:
+            if not self.subscribers:
+                return
+            self.event_id += 1
+            item = (self.event_id, event, json.dumps(data, sort_keys=True))
+            for events in self.subscribers:
+                try:
+                    events.put_nowait(item)
+                except queue.Full:
+                    try:
+                        events.get_nowait()
+                    except queue.Empty:
+                        pass
+                    events.put_nowait(item)
+
+    def __publish_step_change(self, previous_index) -> None:
+        self.__publish("step", {"from": previous_index, "to": self.heatStepIndex, "time": clock.time(),
+                                "heaters": self.__get_step_heaters()})
+
+    def __get_step_heaters(self) -> list:
+        step_heaters = []
+        if self.step is not None:
+            for index in range(self.step.get_heater_count()):
+                heater_name, heater_status = self.step.get_heater_status_tuple(index)
+                step_heaters.append({"name": heater_name, "status": heater_status})
+        return step_heaters
+
+    def __update_metrics(self):
+        """ Sets the gauges of the module metrics from the last readings, without requesting any device. """
+        metrics.pv_watts.set(self.solar.get_watt_pv())
+        metrics.grid_watts.set(self.solar.get_watt_grid())
+        metrics.akku_watts.set(self.solar.get_watt_akku())
+        metrics.akku_charged_percent.set(self.solar.get_charged_percent())
+        metrics.step_index.set(self.heatStepIndex)
+        metrics.loop_interval_seconds.set(self.idle_loop_time_seconds if self.idle
+                                          else self.loop_interval.get_seconds())
+        metrics.idle.set(self.idle)
+        for name, watt in self.__get_known_watts().items():
+            metrics.heater_watts.set(watt, heater=name)
+
+    def __check_idle(self):
+        """ Counts the cycles without production and with all heaters off. Enters the idle mode after idle_cycles. """
+        if self.solar.get_watt_pv() < self.idle_pv_watt and self.heatStepIndex == 0 and heaters.is_all_off():
+            self.idle_count += 1
+        else:
+            self.idle_count = 0
+        if self.idle_count >= self.idle_cycles:
+            self.idle = True
+            heaters.stop_receiving()
+            heaters.close()
+            if self.verbose:
+                print(get_time_string(), "Manager is idle, the heaters are no longer requested.")
+
+    def __idle_cycle(self):
+        """ Requests only the inverter. Leaves the idle mode and controls the heaters again if production returns. """
+        self.solar.update()
+        self.cycle_time = clock.time()
+        self.available = self.__calculate_available()
+        watt_pv = self.solar.get_watt_pv()
+        self.status_print = "%s  (%3.1fk) IDLE" % (get_time_string(), watt_pv / 1000.0)
+        if self.verbose:
+            print(self.status_print)
+        if watt_pv >= self.idle_pv_watt:
+            self.idle = False
+            self.idle_count = 0
+            heaters.start_receiving()
+            if self.verbose:
+                print(get_time_string(), "Manager is active again.")
+            self.__measure_cycle()
+
+    def __sleep(self, seconds):
+        """ Waits for the next cycle. A pushed heater update or stop() ends the waiting early.
+
+        :return: bool: True if the waiting ended early
+        """
+        woken = clock.wait(self.wake_event, seconds)
+        self.wake_event.clear()
+        return woken
+
+    def __sleep_and_modulate(self, seconds):
+        """ Waits for the next cycle. In the modulation mode the steps are alternated meanwhile,
+            without requesting the inverter or the heater status.
+        """
+        end = clock.time() + seconds
+        while self.modulation and not self.idle and self.modulator.lower_index is not None:
+            switch_seconds = self.modulator.get_seconds_to_switch(clock.time())
+            if switch_seconds is None or switch_seconds >= end - clock.time():
+                break
+            if self.__sleep(switch_seconds):
+                return
+            self.__modulate()
+        self.__sleep(max(end - clock.time(), 0))
+
+    def __modulate(self):
+        """ Sets the step chosen by the modulator. Only the heaters that change are commanded. """
+        previous_index = self.heatStepIndex
+        self.heatStepIndex = self.modulator.get_index(clock.time())
+        st = heatSteps.get_step(self.heatStepIndex)
+        if st != self.step:
+            st.set_all_heater(self.verbose)
+            self.step = st
+            self.__publish_step_change(previous_index)
+
+    def __wake_up(self, heater):
+        if self.verbose:
+            print(get_time_string(), "Heater %r changed to %r" % (heater.name, heater.get_known_status()))
+        self.wake_event.set()
+
+    def __store_cycle(self, available):
+        """ Adds the energy of the heaters and the readings of the cycle to the energy store, if it is open. """
+        if heaters.energyStore is None:
+            return
+        heaters.store_watt_hours()
+        heaters.energyStore.add_reading(self.solar.get_watt_pv(), self.solar.get_watt_grid(),
+                                        self.solar.get_watt_akku(), self.solar.get_charged_percent(), available,
+                                        self.heatStepIndex)
+
     def __get_status_and_available(self):
         if self.solar is None or self.step is None:
             return ""
-        now = get_time_string()
         self.solar.update()
+        return self.__publish_status(self.loop_interval.get_seconds())
+
+    def __publish_status(self, loop_seconds):
+        """ Builds status_print from the last readings of the inverter and the status snapshots.
+
+        :param loop_seconds: seconds until the next cycle, shown at the end of the status line
+        :return: float: available power in Watt
+        """
+        now = get_time_string()
         watt_pv = self.solar.get_watt_pv() / 1000.0
         watt_grid = self.solar.get_watt_grid()  # negative into the grid
         watt_akku = self.solar.get_watt_akku()  # negative into the akku
         watt_minimal_charge = - self.solar.get_watt_minimum_charge()
         percent = self.solar.get_charged_percent()
+        available = self.__calculate_available()
+        total_kwh = heaters.get_total_watt_hours() / 1000.0
+        heater_string = self.step.get_all_heater_status_tuple_as_string()
+        self.status_print = \
+            "%s  (%3.1fk) %+8.1f GRD %+8.1f AKK (%2.1f) %8.1f MIN %+8.1f AVA %s %.1f kWh %3.0fs" % \
+            (now, watt_pv, watt_grid, watt_akku, percent, watt_minimal_charge, available, heater_string, total_kwh,
+             loop_seconds)
+        return available
+
+    def __calculate_available(self):
+        """ Calculates the available power from the last readings of the inverter and the status snapshots. """
+        watt_grid = self.solar.get_watt_grid()  # negative into the grid
+        watt_akku = self.solar.get_watt_akku()  # negative into the akku
+        watt_minimal_charge = - self.solar.get_watt_minimum_charge()
         # --- available ---
         # watt_grid < 0 and watt_akku < 0, if excess energy goes into these systems.
         # watt_minimal_charge < 0, since charging power is always negative in the system.
@@ -145,25 +453,83 @@ class HeatManager(threading.Thread):
         # So really available is first:  - watt_grid - watt_akku
         # We need to subtract the minimum charge current from that: watt_minimal_charge
         # But if electricity is already flowing into the heaters, then we have to take this into account.
-        # self.step.get_total_watt() has to calculate the really current flow,
+        # self.step.get_known_total_watt() calculates the really current flow from the status snapshots,
         # not the theoretical load level of the HeatStep.
-        available = round(- watt_grid - watt_akku + watt_minimal_charge + self.step.get_total_watt(False), 2)
-        total_kwh = heaters.get_total_watt_hours() / 1000.0
-        heater_string = self.step.get_all_heater_status_tuple_as_string()
-        self.status_print = \
-            "%s  (%3.1fk) %+8.1f GRD %+8.1f AKK (%2.1f) %8.1f MIN %+8.1f AVA %s %.1f kWh" % \
-            (now, watt_pv, watt_grid, watt_akku, percent, watt_minimal_charge, available, heater_string, total_kwh)
-        return available
+        return round(- watt_grid - watt_akku + watt_minimal_charge + self.step.get_known_total_watt(), 2)
+
+    def __add_history(self):
+        """ Adds the readings of the last cycle to the history, in the measure loop, the try loop and when idle. """
+        self.history.add(self.cycle_time, self.solar.get_watt_pv(), self.solar.get_watt_grid(),
+                         self.solar.get_watt_akku(), self.solar.get_charged_percent(), self.available,
+                         self.heatStepIndex, self.__get_known_watts())
+
+    @staticmethod
+    def __get_known_watts() -> dict:
+        """ Returns the load of each heater from its status snapshot, without requesting any device.
+
+            A heater without snapshot, e.g. disabled or with a connection error, counts with 0 Watt like in
+            the energy integration, so it does not keep showing its last load.
+
+        :return: dict: heater name -> load in Watt
+        """
+        return {heater.name: heater.get_known_watt() or 0 for heater in heaters.list}
 
     def get_status_print(self):
-        self.__get_status_and_available()
+        """ Returns the status published by the last cycle. Only a stopped manager requests the devices. """
+        if not self.running:
+            self.__get_status_and_available()
         return self.status_print
 
+    def get_info_print(self):
+        """ Returns the heater information published by the last cycle, like get_status_print(). """
+        if not self.running or not self.info_print:
+            return heat("info")
+        return self.info_print
+
+    def get_status_document(self) -> dict:
+        """ Builds the status for the JSON API of the HeatServer from the last cycle, without requesting any device.
+
+        :return: dict with the keys 'manager', 'solar', 'step', 'heaters', 'energy' and 'switch'
+        """
+        heater_list = []
+        for heater in heaters.list:
+            heater_list.append({"name": heater.name, "status": heater.get_known_status(),
+                                "watt": heater.get_known_watt(), "enabled": heater.enabled,
+                                "available": heater.is_available(), "watt_hours": round(heater.wattHours, 1)})
+        switch_tuple = self.heatStepList[0].switch_tuple if self.heatStepList else None
+        energy = {"watt_hours": round(sum(heater.wattHours for heater in heaters.list), 1)}
+        if heaters.energyStore is not None:
+            for key, watt_hours in heaters.energyStore.get_current_watt_hours().items():
+                energy[key + "_watt_hours"] = round(watt_hours, 1)
+        return {"manager": {"running": self.running,
+                            "idle": self.idle,
+                            "cycle_time": self.cycle_time,
+                            "available": self.available,
+                            "modulation_duty": self.modulator.duty if self.modulation else None,
+                            "forecast": round(self.forecaster.predict(self.loop_interval.get_seconds()), 1)
+                            if self.forecasting else None,
+                            "loop_seconds": self.idle_loop_time_seconds if self.idle
+                            else self.loop_interval.get_seconds()},
+                "solar": {"watt_pv": self.solar.get_watt_pv(),
+                          "watt_grid": self.solar.get_watt_grid(),
+                          "watt_akku": self.solar.get_watt_akku(),
+                          "watt_load": self.solar.get_watt_load(),
+                          "charged_percent": self.solar.get_charged_percent(),
+                          "supply_to_grid": self.solar.is_supply_to_grid()},
+                "step": {"index": self.heatStepIndex,
+                         "count": self.step_count,
+                         "nominal_watt": self.step.get_nominal_total_watt() if self.step is not None else 0,
+                         "heaters": self.__get_step_heaters()},
+                "heaters": heater_list,
+                "energy": energy,
+                "switch": list(switch_tuple) if switch_tuple else None}
+
     def inform_about_new_step_definition(self):
         self.dynamic_config_change = True
 
     def stop(self):
         self.running = False
+        self.wake_event.set()
 
 
 manager = HeatManager()
@@ -197,6 +563,10 @@ def status():
     return manager.get_status_print()
 
 
+def info():
+    return manager.get_info_print()
+
+
 # -------------------------------------------------------------------------------
 # Test
 # -------------------------------------------------------------------------------
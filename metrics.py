@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+import contextlib
+import math
+import threading
+import time
+
+
+class Metric:
+    """ Base class of the metrics. Holds one value per combination of label values. """
+
+    type = "untyped"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError("Metric %r needs the labels %r" % (self.name, self.label_names))
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _label_string(self, key, extra=None) -> str:
+        pairs = list(zip(self.label_names, key))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{%s}" % ",".join('%s="%s"' % (name, escape(value)) for name, value in pairs)
+
+    def _samples(self) -> list:
+        return []
+
+    def expose(self) -> str:
+        """ Returns the metric in the Prometheus text format. """
+        lines = ["# HELP %s %s" % (self.name, self.help_text), "# TYPE %s %s" % (self.name, self.type)]
+        with self.lock:
+            lines.extend(self._samples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """ Value that only increases, e.g. the number of errors. """
+
+    type = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, label_names)
+        if not self.label_names:
+            self.values[()] = 0
+
+    def inc(self, amount=1, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def _samples(self) -> list:
+        return ["%s%s %s" % (self.name, self._label_string(key), format_value(value))
+                for key, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    """ Current value that can go up and down, e.g. the available power. """
+
+    type = "gauge"
+
+    def set(self, value, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def _samples(self) -> list:
+        return ["%s%s %s" % (self.name, self._label_string(key), format_value(value))
+                for key, value in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    """ Distribution of durations in seconds, counted in cumulative buckets. """
+
+    type = "histogram"
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, name, help_text, label_names=(), buckets=default_buckets):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """ Observes the duration of a with block, also if it raises an exception. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> list:
+        lines = []
+        for key, (counts, total) in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append("%s_bucket%s %d" % (self.name, self._label_string(key, ("le", format_value(bound))),
+                                                 count))
+            lines.append("%s_bucket%s %d" % (self.name, self._label_string(key, ("le", "+Inf")), counts[-1]))
+            lines.append("%s_sum%s %s" % (self.name, self._label_string(key), format_value(total)))
+            lines.append("%s_count%s %d" % (self.name, self._label_string(key), counts[-1]))
+        return lines
+
+
+class Registry:
+    """ Collects the metrics and exposes them for the path /metrics of the HeatServer. """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        return "".join(metric.expose() for metric in self.metrics)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+# --------------------------------
+# latencies and errors
+# --------------------------------
+solar_update_seconds = registry.register(Histogram(
+    "solarheat_solar_update_seconds", "Duration of the requests to the inverter in Solar.update()."))
+solar_update_errors = registry.register(Counter(
+    "solarheat_solar_update_errors_total", "Failed requests to the inverter."))
+heater_status_seconds = registry.register(Histogram(
+    "solarheat_heater_status_seconds", "Duration of the status requests to a heater device.", ["heater"]))
+heater_set_load_seconds = registry.register(Histogram(
+    "solarheat_heater_set_load_seconds", "Duration of Heater.set_load().", ["heater"]))
+heater_errors = registry.register(Counter(
+    "solarheat_heater_errors_total", "Connection errors of a heater device.", ["heater"]))
+heater_timeouts = registry.register(Counter(
+    "solarheat_heater_timeouts_total", "Calls of Heaters.for_each() a heater did not answer in time.", ["heater"]))
+step_transition_seconds = registry.register(Histogram(
+    "solarheat_step_transition_seconds", "Duration of HeatStep.set_all_heater()."))
+cycle_seconds = registry.register(Histogram(
+    "solarheat_cycle_seconds", "Duration of a cycle of the HeatManager."))
+cycle_errors = registry.register(Counter(
+    "solarheat_cycle_errors_total", "Cycles of the HeatManager ended by an exception."))
+
+# --------------------------------
+# current state
+# --------------------------------
+available_watts = registry.register(Gauge(
+    "solarheat_available_watts", "Power available for heating."))
+pv_watts = registry.register(Gauge(
+    "solarheat_pv_watts", "Photovoltaic production."))
+grid_watts = registry.register(Gauge(
+    "solarheat_grid_watts", "Power flow from (+) or to (-) the grid."))
+akku_watts = registry.register(Gauge(
+    "solarheat_akku_watts", "Power flow from (+) or to (-) the accumulator."))
+akku_charged_percent = registry.register(Gauge(
+    "solarheat_akku_charged_percent", "State of charge of the accumulator."))
+step_index = registry.register(Gauge(
+    "solarheat_step_index", "Index of the current heat step."))
+heater_watts = registry.register(Gauge(
+    "solarheat_heater_watts", "Current load of a heater.", ["heater"]))
+loop_interval_seconds = registry.register(Gauge(
+    "solarheat_loop_interval_seconds", "Current interval of the measure loop."))
+idle = registry.register(Gauge(
+    "solarheat_idle", "1 if the HeatManager is idle."))
+
+
+# -------------------------------------------------------------------------------
+# Test
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    with heater_status_seconds.time(heater="black"):
+        time.sleep(0.02)
+    heater_errors.inc(heater="black")
+    available_watts.set(1234.5)
+    print(registry.expose())
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+
+class Modulator:
+    """ Alternates between two adjacent heat steps, so the average load follows the available power.
+
+        If 'available' lies between the totals of the steps lower_index and lower_index + 1, the upper
+        step is used for the share 'duty' of every window of window_seconds and the lower step for the
+        rest. A step is kept for at least min_dwell_seconds to protect the relays of the heaters: shorter
+        shares are rounded to a whole window of the lower or the upper step. So there are at most two
+        switches per window and at most 3600 / min_dwell_seconds per hour.
+    """
+
+    window_seconds = 600
+    min_dwell_seconds = 120
+
+    # the adjacent steps and the share of the upper step, set by update()
+    lower_index = None
+    duty = 0.0
+    window_start = None
+    # the step chosen last and the time it was chosen
+    index = None
+    switch_time = None
+
+    def __init__(self, window_seconds=600, min_dwell_seconds=120):
+        self.window_seconds = window_seconds
+        self.min_dwell_seconds = min(min_dwell_seconds, window_seconds / 2)
+
+    def update(self, now, lower_index, duty) -> int:
+        """ Sets the adjacent steps and the duty measured in a cycle of the manager.
+
+        :param now: time in seconds
+        :param lower_index: index of the highest effective step not above the available power
+        :param duty: share of the upper step, (available - lower total) / (upper total - lower total)
+        :return: int: index of the step to be used now
+        """
+        if self.index not in (lower_index, lower_index + 1):
+            # a new pair starts with a new window
+            self.window_start = None
+        self.lower_index = lower_index
+        self.duty = min(max(duty, 0.0), 1.0)
+        if self.window_start is None:
+            self.window_start = now
+        return self.get_index(now)
+
+    def reset(self) -> None:
+        """ Forgets the adjacent steps, e.g. if the available power reaches the top step. Nothing is alternated
+            until the next update().
+        """
+        self.lower_index = None
+        self.duty = 0.0
+        self.window_start = None
+
+    def get_index(self, now) -> int:
+        """ Returns the index of the step to be used now, keeping the last step for min_dwell_seconds. """
+        desired = self.lower_index + 1 if self.__get_phase(now) < self.__get_upper_seconds() else self.lower_index
+        if self.index is not None and desired != self.index:
+            alternating = {self.index, desired} == {self.lower_index, self.lower_index + 1}
+            if alternating and now - self.switch_time < self.min_dwell_seconds:
+                return self.index
+        if desired != self.index:
+            self.index = desired
+            self.switch_time = now
+        return self.index
+
+    def get_seconds_to_switch(self, now):
+        """ Returns the seconds until the step has to be changed, at least one, None if no change is planned. """
+        upper_seconds = self.__get_upper_seconds()
+        if self.lower_index is None or upper_seconds in (0, self.window_seconds):
+            return None
+        phase = self.__get_phase(now)
+        seconds = upper_seconds - phase if phase < upper_seconds else self.window_seconds - phase
+        if self.switch_time is not None:
+            seconds = max(seconds, self.min_dwell_seconds - (now - self.switch_time))
+        return max(seconds, 1)
+
+    def __get_upper_seconds(self) -> float:
+        upper_seconds = self.duty * self.window_seconds
+        if upper_seconds < self.min_dwell_seconds:
+            return 0
+        if self.window_seconds - upper_seconds < self.min_dwell_seconds:
+            return self.window_seconds
+        return upper_seconds
+
+    def __get_phase(self, now) -> float:
+        """ Returns the seconds since the start of the current window. """
+        if now - self.window_start >= self.window_seconds:
+            self.window_start += (now - self.window_start) // self.window_seconds * self.window_seconds
+        return now - self.window_start
+
+
+# -------------------------------------------------------------------------------
+# Test
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    test_modulator = Modulator(600, 120)
+    test_time = 0
+    test_modulator.update(test_time, 2, 0.4)
+    while test_time < 1800:
+        test_index = test_modulator.get_index(test_time)
+        test_seconds = test_modulator.get_seconds_to_switch(test_time)
+        print("%5d s: step %d, next switch in %s s" % (test_time, test_index, test_seconds))
+        test_time += test_seconds
@@ -1,8 +1,14 @@
 #!/usr/bin/python3
 # coding=UTF-8
 
+import gzip
+import hashlib
 import http.server
+import json
+import queue
+import threading
 from urllib.parse import parse_qs
+import metrics
 from manager import *
 
 
@@ -19,7 +25,13 @@ def run_server() -> None:
     print(get_time_string(), "HeatServer stops")
 
 
-class HeatServer(http.server.HTTPServer):
+class HeatServer(http.server.ThreadingHTTPServer):
+    """ Answers each request in its own thread, so a slow request does not block other clients.
+
+        Status and info are served from the snapshots published by the manager cycle.
+    """
+
+    daemon_threads = True
 
     def __init__(self, server_address_port, request_handler) -> None:
         super().__init__(server_address_port, request_handler)
@@ -39,12 +51,38 @@ class HeatHandler(http.server.SimpleHTTPRequestHandler):
     do=disable&heater=name              - disable a heater
     do=switch&heater=name&heater=name   - exchanges two heaters in the HeatSteps definition
     do=clear                            - deletes the exchange of heaters
+
+    /metrics                            - metrics in the Prometheus text format
+    /api/v1/status                      - JSON: solar, step, heaters, energy and switch of the last cycle
+    /api/v1/solar, /api/v1/heaters, ... - JSON: a single part of /api/v1/status
+    /api/v1/events                      - Server-Sent Events: 'cycle' with /api/v1/status, 'step' on step changes
+    /api/v1/history?resolution=15m&start=today&end=...
+                                        - JSON: readings and energies per 'raw', '1m', '15m' or '1h' since start
     """
 
+    api_path = "/api/v1/"
+    # JSON bodies of the last published manager cycle: path -> [body, ETag, gzip compressed body or None]
+    document_cache = {}
+    document_cache_time = None
+    document_cache_size = 32
+    document_cache_lock = threading.Lock()
+    # a comment line is sent to the clients of the event stream if there was no event for this time
+    keep_alive_seconds = 15
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory="/", **kwargs)
 
     def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            self.__send_metrics()
+            return
+        if path == self.api_path + "events":
+            self.__send_events()
+            return
+        if path.startswith(self.api_path):
+            self.__send_api(path[len(self.api_path):])
+            return
         start = self.requestline.find("?")
         kvp = {}
         if start > 0:
@@ -56,7 +94,7 @@ class HeatHandler(http.server.SimpleHTTPRequestHandler):
             if arg == 'help':
                 response = self.usage
             elif arg == 'info':
-                response = heat("info")
+                response = info()
             elif arg == 'status':
                 response = status()
             elif arg == "silent":
@@ -107,13 +145,144 @@ class HeatHandler(http.server.SimpleHTTPRequestHandler):
                 response = "Switching of heaters is withdrawn."
             else:
                 response = "You get help with '?do=help'"
+            # a command can change the configuration shown by the JSON API before the next cycle
+            self.clear_document_cache()
         self.send_response(200)
         self.send_header("Content-type", "text/plain")
         self.end_headers()
         self.wfile.write(response.encode("utf8"))
 
+    def __send_api(self, name):
+        """ Sends the status document or one of its parts as JSON.
+
+            The ETag is a hash of the body, so it only changes with the next manager cycle or a changed
+            configuration. Then a request with a matching If-None-Match header gets 304 without a body.
+            The gzip compressed body has its own ETag. While the manager runs, body and ETag are built
+            once per cycle and path.
+        """
+        entry = self.__get_cached_document()
+        if entry is None:
+            if name == "history":
+                try:
+                    document = self.__get_history()
+                except ValueError as inst:
+                    self.send_error(400, ' '.join(str(arg) for arg in inst.args))
+                    return
+            else:
+                document = manager.get_status_document()
+                if name not in ("status", ""):
+                    if name not in document:
+                        self.send_error(404, "Unknown resource %r" % name)
+                        return
+                    document = document[name]
+            body = json.dumps(document, sort_keys=True).encode("utf8")
+            entry = [body, '"%s"' % hashlib.sha1(body).hexdigest(), None]
+            self.__cache_document(entry)
+        body, etag, gzip_body = entry
+        encoding = "gzip" if "gzip" in self.headers.get("Accept-Encoding", "") else None
+        if encoding:
+            etag = etag[:-1] + '-gzip"'
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        if encoding:
+            if gzip_body is None:
+                gzip_body = gzip.compress(body)
+                entry[2] = gzip_body
+            body = gzip_body
+        self.send_response(200)
+        self.send_header("Content-type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __get_cached_document(self):
+        """ Returns the cached entry of this path if it belongs to the last published cycle, otherwise None.
+
+            A stopped manager publishes no cycles, then nothing is cached.
+        """
+        if not manager.is_running():
+            return None
+        with HeatHandler.document_cache_lock:
+            if HeatHandler.document_cache_time != manager.cycle_time:
+                HeatHandler.document_cache = {}
+                HeatHandler.document_cache_time = manager.cycle_time
+            return HeatHandler.document_cache.get(self.path)
+
+    def __cache_document(self, entry) -> None:
+        if not manager.is_running():
+            return
+        with HeatHandler.document_cache_lock:
+            if len(HeatHandler.document_cache) >= self.document_cache_size:
+                HeatHandler.document_cache = {}
+            HeatHandler.document_cache[self.path] = entry
+
+    @staticmethod
+    def clear_document_cache() -> None:
+        """ Lets the next API request build its document again, e.g. after a command changed the configuration. """
+        with HeatHandler.document_cache_lock:
+            HeatHandler.document_cache = {}
+
+    def __get_history(self) -> dict:
+        """ Queries the history of the manager with the parameters resolution, start and end.
+
+            start and end are seconds since the epoch or 'today' for midnight.
+        """
+        kvp = parse_qs(self.path.partition("?")[2])
+        times = {}
+        for key in ("start", "end"):
+            value = kvp.get(key, [None])[0]
+            if value == "today":
+                now = clock.localtime()
+                value = clock.time() - now.tm_hour * 3600 - now.tm_min * 60 - now.tm_sec
+            times[key] = None if value is None else float(value)
+        return manager.history.query(kvp.get("resolution", ["15m"])[0], times["start"], times["end"])
+
+    def __send_events(self):
+        """ Streams the events of the manager until the client disconnects. Starts with the current status. """
+        events = manager.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header("Content-type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.__write_event(None, "cycle", json.dumps(manager.get_status_document(), sort_keys=True))
+            while True:
+                try:
+                    self.__write_event(*events.get(timeout=self.keep_alive_seconds))
+                except queue.Empty:
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            manager.unsubscribe(events)
+
+    def __write_event(self, event_id, event, data):
+        text = "" if event_id is None else "id: %d\n" % event_id
+        text += "event: %s\ndata: %s\n\n" % (event, data)
+        self.wfile.write(text.encode("utf8"))
+        self.wfile.flush()
+
+    def __send_metrics(self):
+        content = metrics.registry.expose().encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
 
 if __name__ == '__main__':
     """ Starts the HeatManager and runs the HTTP server """
+    heaters.open_energy_store()
     start_manager(verbose=True)  # set False by default
     run_server()
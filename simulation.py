@@ -0,0 +1,276 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+import json
+
+from clock import *
+from heaters import Heaters
+from solarSimulator import Recording
+from tuyaSimulator import *
+
+# The heaters of heaters.json are replaced by virtual heaters without latency,
+# before the module heat creates the Heaters object.
+with open(Heaters.heatersFile, 'r') as heaters_json:
+    simulator = TuyaSimulator.for_definitions(json.load(heaters_json), latency_seconds=0, latency_jitter_seconds=0,
+                                              time_scale=0)
+simulator.install()
+
+from manager import *
+
+
+class SimulationMetrics:
+    """ Results of a simulation run. Energies in kWh. """
+
+    def __init__(self):
+        self.pv_kwh = 0.0
+        self.house_kwh = 0.0
+        self.heated_kwh = 0.0
+        # energy taken from the grid by the heaters
+        self.heated_from_grid_kwh = 0.0
+        self.grid_import_kwh = 0.0
+        self.grid_export_kwh = 0.0
+        # number of heater changes: on, off or another load
+        self.switching_events = 0
+        # checks of the modulation mode finding a step below the top step while available reaches it
+        self.modulation_top_drops = 0
+        # days with the accumulator charged up to Solar.max_charge at Solar.full_akk_hour
+        self.akku_days = 0
+        self.akku_target_days = 0
+        self.wall_seconds = 0.0
+
+    def get_self_consumed_kwh(self) -> float:
+        """ Photovoltaic energy used in the house, by the heaters or by the accumulator. """
+        return self.pv_kwh - self.grid_export_kwh
+
+    def __str__(self):
+        return ("PV %8.1f kWh  self consumed %8.1f kWh  heated %8.1f kWh (%6.1f kWh from grid)  "
+                "import %8.1f kWh  export %8.1f kWh  switching %5d  akku target %d/%d days  (%.1f s)" %
+                (self.pv_kwh, self.get_self_consumed_kwh(), self.heated_kwh, self.heated_from_grid_kwh,
+                 self.grid_import_kwh, self.grid_export_kwh, self.switching_events, self.akku_target_days,
+                 self.akku_days, self.wall_seconds))
+
+
+class HouseModel:
+    """ Model of the house with photovoltaic system, accumulator and the virtual heaters.
+
+        Photovoltaic production and house load are taken from a Recording. The house load is
+        P_PV + P_Grid + P_Akku of the recording. The power of the heaters is added to it.
+        Like the inverter, the accumulator is charged by the surplus and discharged on demand,
+        the rest goes to or comes from the grid.
+    """
+
+    capacity_wh = 10000
+    max_akku_watt = 5000
+    # the model is integrated in steps of at most step_seconds
+    step_seconds = 60
+
+    def __init__(self, recording, start_time, solar_max_charge=90, full_akk_hour=15):
+        """ Initializes the model at the beginning of the recording.
+
+        :param recording: Recording with the photovoltaic production and the house load
+        :param start_time: time of the beginning of the recording in seconds since the epoch
+        :param solar_max_charge: state of charge in percent to be reached at full_akk_hour
+        :param full_akk_hour: hour in which the accumulator should be charged
+        """
+        self.recording = recording
+        self.start_time = start_time
+        self.solar_max_charge = solar_max_charge
+        self.full_akk_hour = full_akk_hour
+        self.seconds = 0.0
+        self.charged_percent = recording.get(0)[3]
+        self.watt_pv = 0.0
+        self.watt_load = 0.0
+        self.watt_akku = 0.0
+        self.watt_grid = 0.0
+        self.metrics = SimulationMetrics()
+        self.last_heater_states = self.__get_heater_states()
+        self.last_akku_day = None
+        self.__step(0)
+
+    def get_end_time(self) -> float:
+        return self.start_time + self.recording.get_duration()
+
+    def advance(self, seconds) -> None:
+        """ Integrates the model over the given seconds, considering the current status of the virtual heaters. """
+        self.__count_switching_events()
+        while seconds > 0:
+            dt = min(seconds, self.step_seconds)
+            self.seconds += dt
+            seconds -= dt
+            self.__step(dt)
+
+    def __step(self, dt) -> None:
+        watt_pv, grid, akku, soc = self.recording.get(self.seconds)
+        watt_house = max(watt_pv + grid + akku, 0)
+        watt_heater = simulator.get_total_watt()
+        surplus = watt_pv - watt_house - watt_heater
+        if surplus > 0:
+            room_wh = (100 - self.charged_percent) / 100 * self.capacity_wh
+            charge = min(surplus, self.max_akku_watt, room_wh * 3600 / dt if dt > 0 else surplus)
+            self.watt_akku = -charge
+        else:
+            stored_wh = self.charged_percent / 100 * self.capacity_wh
+            discharge = min(-surplus, self.max_akku_watt, stored_wh * 3600 / dt if dt > 0 else -surplus)
+            self.watt_akku = discharge
+        self.watt_grid = -(surplus + self.watt_akku)
+        self.watt_pv = watt_pv
+        self.watt_load = -(watt_house + watt_heater)
+        self.charged_percent -= self.watt_akku * dt / 3600 / self.capacity_wh * 100
+        hours = dt / 3600.0
+        metrics = self.metrics
+        metrics.pv_kwh += watt_pv * hours / 1000
+        metrics.house_kwh += watt_house * hours / 1000
+        metrics.heated_kwh += watt_heater * hours / 1000
+        metrics.heated_from_grid_kwh += min(watt_heater, max(self.watt_grid, 0)) * hours / 1000
+        metrics.grid_import_kwh += max(self.watt_grid, 0) * hours / 1000
+        metrics.grid_export_kwh += max(-self.watt_grid, 0) * hours / 1000
+        self.__check_akku_target()
+
+    def __check_akku_target(self) -> None:
+        now = time.localtime(self.start_time + self.seconds)
+        if now.tm_hour == self.full_akk_hour and now.tm_yday != self.last_akku_day:
+            self.last_akku_day = now.tm_yday
+            self.metrics.akku_days += 1
+            if self.charged_percent >= self.solar_max_charge:
+                self.metrics.akku_target_days += 1
+
+    @staticmethod
+    def __get_heater_states() -> list:
+        return [(device.dps.get(str(device.is_on_index)), device.dps.get(str(device.load_index)))
+                for device in simulator.device_list]
+
+    def __count_switching_events(self) -> None:
+        states = self.__get_heater_states()
+        for before, after in zip(self.last_heater_states, states):
+            if before != after and (before[0] or after[0]):
+                self.metrics.switching_events += 1
+        self.last_heater_states = states
+
+
+class SimulatedSolar(Solar):
+    """ Provides the power flows of a HouseModel instead of requesting the inverter. """
+
+    model = None
+
+    def __init__(self, model, supply_to_grid=True):
+        super().__init__()
+        self.model = model
+        self.supply_to_grid = supply_to_grid
+        self.max_charge = model.solar_max_charge
+        self.full_akk_hour = model.full_akk_hour
+
+    def update(self) -> None:
+        self.watt_pv = self.model.watt_pv
+        self.watt_load = self.model.watt_load
+        self.watt_akku = self.model.watt_akku
+        self.watt_grid = self.model.watt_grid
+        self.charged_percent = self.model.charged_percent
+
+
+class Simulation:
+    """ Runs the control loops of the HeatManager against a HouseModel with a virtual clock.
+
+        Instead of waiting, the manager advances the virtual clock and the model follows.
+        A day of control runs in about a second, so parameters like tolerated_akku_grid_usage_in_watt,
+        sticky_cycles or the heat step table can be tuned over long recordings.
+    """
+
+    def __init__(self, recording, start_date="2026-06-21"):
+        """ Initializes the simulation.
+
+        :param recording: Recording with the photovoltaic production and the house load
+        :param start_date: date of the beginning of the recording as 'YYYY-MM-DD', local time
+        """
+        self.recording = recording
+        self.start_time = time.mktime(time.strptime(start_date, "%Y-%m-%d"))
+
+    def run(self, supply_to_grid=True, **parameters) -> SimulationMetrics:
+        """ Runs the measure loop (supply_to_grid = True) or the try loop over the whole recording.
+
+        :param supply_to_grid: True for __measure_loop(), False for __try_loop()
+        :param parameters: attributes of the HeatManager to be changed, e.g. tolerated_akku_grid_usage_in_watt=50
+        :return: SimulationMetrics
+        """
+        self.__reset_heaters()
+        model = HouseModel(self.recording, self.start_time, Solar.max_charge, Solar.full_akk_hour)
+        heat_manager = HeatManager(SimulatedSolar(model, supply_to_grid))
+        heat_manager.set_verbose(False)
+        for name, value in parameters.items():
+            if not hasattr(heat_manager, name):
+                raise ValueError("Unknown HeatManager parameter %r" % name)
+            setattr(heat_manager, name, value)
+        heat_manager.loop_interval = LoopInterval(heat_manager.min_loop_time_seconds,
+                                                  heat_manager.max_loop_time_seconds, heat_manager.loop_time_seconds)
+        heat_manager.modulator = Modulator(heat_manager.modulation_window_seconds,
+                                           heat_manager.modulation_min_dwell_seconds)
+        heat_manager.forecaster = Forecaster()
+
+        def advance(seconds):
+            self.__check_modulation(heat_manager, model.metrics)
+            model.advance(seconds)
+            if clock.time() >= model.get_end_time():
+                heat_manager.stop()
+
+        wall_start = time.time()
+        clock.set_virtual(self.start_time, advance)
+        try:
+            heat_manager.run()
+        finally:
+            clock.set_real()
+        model.metrics.wall_seconds = time.time() - wall_start
+        return model.metrics
+
+    @staticmethod
+    def __check_modulation(heat_manager, metrics) -> None:
+        """ Counts the waits of the modulation mode on a step below the top step, while available reaches it. """
+        if not heat_manager.modulation or heat_manager.idle or heat_manager.available is None:
+            return
+        top_index = heatSteps.get_effective_step_count() - 1
+        if heat_manager.available >= heatSteps.get_step_watt(top_index) and heat_manager.heatStepIndex < top_index:
+            metrics.modulation_top_drops += 1
+
+    @staticmethod
+    def __reset_heaters() -> None:
+        for device in simulator.device_list:
+            device.dps[str(device.is_on_index)] = False
+        for heater in heaters.list:
+            heater.close()
+            heater.statusSnapshot = None
+            heater.connectError = False
+            heater.connectErrorCount = 0
+            heater.wattHours = 0
+            heater.lastChangeTime = None
+            heater.integrationWatt = 0
+
+
+# -------------------------------------------------------------------------------
+# Test
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    import sys
+
+    # python3 simulation.py [recording.csv]
+    test_recording = Recording.read(sys.argv[1]) if len(sys.argv) > 1 else \
+        Recording.synthetic_day(seed=1, cloudiness=0.1)
+    test_simulation = Simulation(test_recording)
+    print("measure loop")
+    for test_max_loop in (60, 300, 900):
+        print("  max loop time %3d s: %s" % (test_max_loop, test_simulation.run(
+            max_loop_time_seconds=test_max_loop)))
+    for test_dwell in (60, 120, 300):
+        test_metrics = test_simulation.run(modulation=True, modulation_min_dwell_seconds=test_dwell)
+        print("  modulation dwell %3d s: %s" % (test_dwell, test_metrics))
+        # the modulation must not leave the top step while the available power reaches it
+        assert test_metrics.modulation_top_drops == 0, test_metrics.modulation_top_drops
+    for test_quantile in (0.8, 0.9, 0.95):
+        Forecaster.quantile = test_quantile
+        print("  forecast quantile %4.2f: %s" % (test_quantile, test_simulation.run(forecasting=True)))
+    Forecaster.quantile = 0.9
+    print("try loop")
+    for test_tolerated in (0, 30, 100):
+        print("  tolerated %4d W: %s" % (test_tolerated, test_simulation.run(
+            False, tolerated_akku_grid_usage_in_watt=test_tolerated)))
+    for test_sticky in (2, 5, 10):
+        print("  sticky %2d:        %s" % (test_sticky, test_simulation.run(False, sticky_cycles=test_sticky)))
@@ -1,20 +1,28 @@
 #!/usr/bin/python
 # coding=UTF-8
-import time
-
-import requests
+import metrics
+from clock import *
+from inverter import *
+from sunspec import *
 
 
 class Solar:
     """ Requests the parameter of the photovoltaic device.
-        This class supports the Fronius Solar API V1.
-        It needs to be adjusted for other power inverters.
+        The realtime data are read by an InverterBackend: FroniusBackend for the Fronius Solar API V1
+        via HTTP or SunSpecBackend for inverters with SunSpec Modbus TCP.
+        Other power inverters need another subclass of InverterBackend.
     """
 
-    # to request the power flow to (-) or from (+) the grid, accumulator and devices
-    watt_url = "http://192.168.178.69/solar_api/v1/GetPowerFlowRealtimeData.fcgi"
-    # to request the state of charge of the accumulator
-    akku_url = "http://192.168.178.69/solar_api/v1/GetStorageRealtimeData.cgi"
+    # the backend: "fronius" for the Fronius Solar API V1 or "sunspec" for SunSpec Modbus TCP
+    inverter = "fronius"
+    # the inverter, e.g. "http://127.0.0.1:8889" to use the stand-in server of solarSimulator.py
+    base_url = "http://192.168.178.69"
+    # the Modbus TCP server of the inverter, e.g. "127.0.0.1" and 8502 for the stand-in of solarSimulator.py
+    modbus_host = "192.168.178.69"
+    modbus_port = 502
+    modbus_unit_id = 1
+    # unit id of the meter if it is not a model of the inverter unit, e.g. 240 for Fronius
+    modbus_meter_unit_id = None
     # the maximum charge level defined for the accumulator
     max_charge = 90
     # does the photovoltaic device supply to the grid?
@@ -24,6 +32,8 @@ class Solar:
     # minimum power flow into the public grid after the accumulator has been charged
     min_grid_after_full_akk: 0
 
+    backend = None
+
     # --------------------------------
     # power flow
     # --------------------------------
@@ -36,36 +46,52 @@ class Solar:
     # --------------------------------
     charged_percent = 0
 
-    def __init__(self):
-        self.update()
+    def __init__(self, base_url=None, backend=None):
+        """ Initializes the connection to the inverter. The realtime data are requested by update().
+
+        :param base_url: URL of the inverter, None for the class attribute base_url
+        :param backend: InverterBackend object, None for the backend chosen by the class attribute inverter
+        :raises
+            ValueError: if the inverter is unknown
+        """
+        if base_url is not None:
+            self.base_url = base_url
+        self.backend = self.__create_backend() if backend is None else backend
+
+    def __create_backend(self) -> InverterBackend:
+        if self.inverter == "fronius":
+            return FroniusBackend(self.base_url)
+        if self.inverter == "sunspec":
+            return SunSpecBackend(self.modbus_host, self.modbus_port, self.modbus_unit_id, self.modbus_meter_unit_id)
+        raise ValueError("Unknown inverter %r" % self.inverter)
 
     def update(self) -> None:
-        """ Updates the solar realtime data """
+        """ Updates the solar realtime data from the backend.
+
+        :raises
+            Exception: if the inverter cannot be reached or does not answer in time,
+            e.g. requests.RequestException or OSError
+        """
+        with metrics.solar_update_seconds.time():
+            try:
+                reading = self.backend.read()
+            except Exception:
+                metrics.solar_update_errors.inc()
+                raise
         # --------------------------------
         # power flow
         # --------------------------------
-        r = requests.get(self.watt_url)
-        response = r.json()
-        r.close()
-        self.__parse_watt(response)
+        self.watt_pv = reading["watt_pv"]
+        self.watt_load = reading["watt_load"]
+        self.watt_akku = reading["watt_akku"]
+        self.watt_grid = reading["watt_grid"]
         # --------------------------------
         # battery state of charge
         # --------------------------------
-        r = requests.get(self.akku_url)
-        response = r.json()
-        r.close()
-        self.__parse_akku(response)
-
-    def __parse_watt(self, response) -> None:
-        site = response["Body"]["Data"]["Site"]
-        self.watt_pv = site["P_PV"]
-        self.watt_load = site["P_Load"]
-        self.watt_akku = site["P_Akku"]
-        self.watt_grid = site["P_Grid"]
-
-    def __parse_akku(self, response) -> None:
-        controller = response["Body"]["Data"]["0"]["Controller"]
-        self.charged_percent = controller["StateOfCharge_Relative"]
+        self.charged_percent = reading["charged_percent"]
+
+    def close(self) -> None:
+        self.backend.close()
 
     def get_watt_pv(self) -> int:
         return round(self.watt_pv, 2)
@@ -91,7 +117,7 @@ class Solar:
         :return: int: minimum current in watts
         """
         to_charge = self.max_charge - self.get_charged_percent()
-        now = time.localtime()
+        now = clock.localtime()
         hour = now.tm_hour
         period = self.full_akk_hour - hour
         if period > 0:
@@ -114,6 +140,7 @@ class Solar:
 
 if __name__ == '__main__':
     s = Solar()
+    s.update()
     print("PV: %r  LOAD: %r  GRID: %r  AKKU: %r" %
           (s.get_watt_pv(), s.get_watt_load(), s.get_watt_grid(), s.get_watt_akku()))
     print("AKKU Charge: %r" % s.get_charged_percent())
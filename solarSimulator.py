@@ -0,0 +1,322 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+import bisect
+import csv
+import http.server
+import json
+import math
+import random
+import socketserver
+import struct
+import threading
+import time
+
+
+class Recording:
+    """ Recorded readings of the photovoltaic system, replayed by the SolarSimulator.
+
+        A recording is a CSV file with the columns seconds, P_PV, P_Grid, P_Akku and SoC.
+        'seconds' counts from the beginning of the first recorded day, so several days follow each other.
+        Between two samples the values are interpolated linearly.
+    """
+
+    columns = ["seconds", "P_PV", "P_Grid", "P_Akku", "SoC"]
+
+    def __init__(self, rows):
+        """ Initializes the recording.
+
+        :param rows: list of tuples (seconds, P_PV, P_Grid, P_Akku, SoC), ascending by seconds
+        """
+        self.rows = sorted(rows)
+        self.seconds = [row[0] for row in self.rows]
+
+    @classmethod
+    def read(cls, path):
+        """ Reads a recording from a CSV file with the columns of Recording.columns. """
+        with open(path, newline='') as f:
+            return cls([tuple(float(row[column]) for column in cls.columns) for row in csv.DictReader(f)])
+
+    def write(self, path) -> None:
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.columns)
+            writer.writerows(self.rows)
+
+    @classmethod
+    def synthetic_day(cls, peak_pv=8000, house_load=400, capacity_wh=10000, max_akku=5000, soc=20, seed=None,
+                      cloudiness=0.0):
+        """ Generates one day in steps of one minute: a clear sky from 6 to 20 o'clock, a constant house load
+            with some noise and an accumulator charged by the surplus before the rest goes into the grid.
+
+        :param cloudiness: probability per minute that a cloud comes or goes, a cloud lets 30 % of the sun through
+        :return: Recording
+        """
+        generator = random.Random(seed)
+        clouds = random.Random(None if seed is None else seed + 1)
+        cloudy = False
+        rows = []
+        for minute in range(24 * 60):
+            hour = minute / 60.0
+            pv = peak_pv * math.sin(math.pi * (hour - 6) / 14) if 6 < hour < 20 else 0
+            if cloudiness > 0 and clouds.random() < cloudiness:
+                cloudy = not cloudy
+            if cloudy:
+                pv *= 0.3
+            surplus = pv - house_load * generator.uniform(0.8, 1.5)
+            if surplus > 0:
+                akku = -min(surplus, max_akku, (100 - soc) * capacity_wh / 100 * 60)
+            else:
+                akku = min(-surplus, max_akku, soc * capacity_wh / 100 * 60)
+            soc = min(max(soc - akku / 60 / capacity_wh * 100, 0), 100)
+            grid = -(surplus + akku)
+            rows.append((minute * 60, round(pv, 1), round(grid, 1), round(akku, 1), round(soc, 1)))
+        return cls(rows)
+
+    def get_duration(self) -> float:
+        return self.seconds[-1] if self.seconds else 0
+
+    def get(self, seconds) -> tuple:
+        """ Returns the interpolated readings at the given point of the recording.
+
+        :param seconds: seconds since the beginning of the recording
+        :return: tuple (P_PV, P_Grid, P_Akku, SoC)
+        """
+        i = bisect.bisect_right(self.seconds, seconds)
+        if i == 0:
+            return self.rows[0][1:]
+        if i == len(self.rows):
+            return self.rows[-1][1:]
+        before, after = self.rows[i - 1], self.rows[i]
+        share = (seconds - before[0]) / (after[0] - before[0])
+        return tuple(b + (a - b) * share for b, a in zip(before[1:], after[1:]))
+
+
+def record(solar, path, interval_seconds=60, count=24 * 60) -> None:
+    """ Records the readings of a Solar object into a CSV file, which can be replayed by the SolarSimulator.
+
+    :param solar: Solar object connected to the real inverter
+    :param path: CSV file
+    :param interval_seconds: time between two readings
+    :param count: number of readings, by default one day
+    """
+    start = time.time()
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(Recording.columns)
+        for i in range(count):
+            solar.update()
+            writer.writerow([round(time.time() - start), solar.get_watt_pv(), solar.get_watt_grid(),
+                             solar.get_watt_akku(), solar.get_charged_percent()])
+            f.flush()
+            time.sleep(interval_seconds)
+
+
+class Replay:
+    """ Replays a Recording at accelerated speed, the common part of the stand-in servers. """
+
+    recording = None
+    speed = 1.0
+    start_time = 0
+    # number of answered requests
+    request_count = 0
+    # seconds of the recording at the start of the replay
+    offset_seconds = 0
+
+    def start_replay(self, recording, speed, offset_seconds) -> None:
+        self.recording = recording
+        self.speed = speed
+        self.offset_seconds = offset_seconds
+        self.start_time = time.time()
+
+    def get_seconds(self) -> float:
+        """ Returns the current position in the recording in seconds. """
+        return self.offset_seconds + (time.time() - self.start_time) * self.speed
+
+    def is_finished(self) -> bool:
+        return self.get_seconds() >= self.recording.get_duration()
+
+    def start_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="solar-simulator", daemon=True)
+        thread.start()
+        return thread
+
+
+class SolarSimulator(Replay, http.server.ThreadingHTTPServer):
+    """ Stand-in server for the Fronius Solar API V1, replaying a Recording at accelerated speed.
+
+        Serves GetPowerFlowRealtimeData.fcgi and GetStorageRealtimeData.cgi like the inverter.
+        With speed = 1440 a recorded day is replayed in one minute. Set Solar.base_url to get_url().
+    """
+
+    def __init__(self, recording, speed=1.0, port=8889, offset_seconds=0):
+        """ Initializes the server without starting it.
+
+        :param recording: Recording to replay
+        :param speed: factor of the replay speed
+        :param port: port of the server, 0 to choose a free one
+        :param offset_seconds: seconds of the recording to start with, e.g. 6 * 3600 for 6 o'clock
+        """
+        super().__init__(("127.0.0.1", port), SolarSimulatorHandler)
+        self.start_replay(recording, speed, offset_seconds)
+
+    def get_url(self) -> str:
+        return "http://%s:%d" % self.server_address[:2]
+
+    def get_power_flow(self) -> dict:
+        pv, grid, akku, soc = self.recording.get(self.get_seconds())
+        # P_Load is negative if energy is consumed, the sum of all power flows is zero
+        site = {"Mode": "bidirectional", "P_PV": pv, "P_Grid": grid, "P_Akku": akku,
+                "P_Load": -(pv + grid + akku)}
+        return self.__response({"Site": site})
+
+    def get_storage(self) -> dict:
+        soc = self.recording.get(self.get_seconds())[3]
+        return self.__response({"0": {"Controller": {"StateOfCharge_Relative": soc}}})
+
+    @staticmethod
+    def __response(data) -> dict:
+        return {"Body": {"Data": data},
+                "Head": {"Status": {"Code": 0, "Reason": "", "UserMessage": ""},
+                         "Timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}}
+
+
+class SolarSimulatorHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path.endswith("/GetPowerFlowRealtimeData.fcgi"):
+            response = self.server.get_power_flow()
+        elif path.endswith("/GetStorageRealtimeData.cgi"):
+            response = self.server.get_storage()
+        else:
+            self.send_error(404)
+            return
+        content = json.dumps(response).encode("utf8")
+        self.server.request_count += 1
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SunSpecSimulator(Replay, socketserver.ThreadingTCPServer):
+    """ Stand-in Modbus TCP server of a SunSpec inverter, replaying a Recording at accelerated speed.
+
+        Answers Read Holding Registers of unit unit_id with the models common (1), inverter (103),
+        storage (124) and meter (203) from base_register on. The AC power of the inverter is PV plus
+        accumulator, so SunSpecBackend gets the power flows of the recording back.
+        Set Solar.inverter = "sunspec", Solar.modbus_host and Solar.modbus_port to get_address().
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    base_register = 40000
+    unit_id = 1
+
+    def __init__(self, recording, speed=1.0, port=8502, offset_seconds=0):
+        """ Initializes the server without starting it, see SolarSimulator. """
+        super().__init__(("127.0.0.1", port), SunSpecSimulatorHandler)
+        self.start_replay(recording, speed, offset_seconds)
+
+    def get_address(self) -> tuple:
+        return self.server_address[:2]
+
+    def get_registers(self) -> list:
+        """ Returns the SunSpec registers from base_register on with the current readings. """
+        pv, grid, akku, soc = self.recording.get(self.get_seconds())
+        common = [0] * 66
+        common[0:8] = self.__text("SolarHeat", 8)
+        common[16:32] = self.__text("SunSpecSimulator", 16)
+        inverter = [0x8000] * 50
+        # W and W_SF, DCW and DCW_SF with the scale factor 0, the int16 values in two's complement
+        inverter[12:14] = [round(pv + akku) & 0xFFFF, 0]
+        inverter[29:31] = [round(pv) & 0xFFFF, 0]
+        storage = [0x8000] * 24
+        # ChaState in 1/10 percent with ChaState_SF = -1
+        storage[6] = round(soc * 10)
+        storage[20] = -1 & 0xFFFF
+        meter = [0x8000] * 105
+        meter[16] = round(grid) & 0xFFFF
+        meter[20] = 0
+        return ([0x5375, 0x6e53, 1, len(common)] + common + [103, len(inverter)] + inverter +
+                [124, len(storage)] + storage + [203, len(meter)] + meter + [0xFFFF, 0])
+
+    @staticmethod
+    def __text(text, length) -> list:
+        data = text.encode("ascii").ljust(2 * length, b"\0")
+        return list(struct.unpack(">%dH" % length, data))
+
+
+class SunSpecSimulatorHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            header = self.__receive(7)
+            if header is None:
+                return
+            transaction_id, protocol_id, length, unit_id = struct.unpack(">HHHB", header)
+            pdu = self.__receive(length - 1)
+            if pdu is None:
+                return
+            self.request.sendall(self.__answer(transaction_id, unit_id, pdu))
+
+    def __answer(self, transaction_id, unit_id, pdu) -> bytes:
+        function = pdu[0]
+        if function != 3:
+            answer = struct.pack(">BB", function | 0x80, 1)
+        elif unit_id != self.server.unit_id:
+            answer = struct.pack(">BB", 0x83, 11)
+        else:
+            address, count = struct.unpack(">HH", pdu[1:5])
+            registers = self.server.get_registers()
+            first = address - self.server.base_register
+            if first < 0 or count < 1 or count > 125 or first + count > len(registers):
+                answer = struct.pack(">BB", 0x83, 2)
+            else:
+                answer = struct.pack(">BB%dH" % count, 3, 2 * count, *registers[first:first + count])
+                self.server.request_count += 1
+        return struct.pack(">HHHB", transaction_id, 0, len(answer) + 1, unit_id) + answer
+
+    def __receive(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+
+# -------------------------------------------------------------------------------
+# Test
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    import sys
+
+    # python3 solarSimulator.py [recording.csv | synthetic] [speed] [port] [fronius | sunspec]
+    test_recording = Recording.synthetic_day(seed=1)
+    if len(sys.argv) > 1 and sys.argv[1] != "synthetic":
+        test_recording = Recording.read(sys.argv[1])
+    test_speed = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    test_port = int(sys.argv[3]) if len(sys.argv) > 3 else 8889
+    if len(sys.argv) > 4 and sys.argv[4] == "sunspec":
+        test_server = SunSpecSimulator(test_recording, test_speed, test_port)
+        print("SunSpecSimulator replays %.1f hours with speed %r - set Solar.inverter = 'sunspec', "
+              "Solar.modbus_host, Solar.modbus_port = %r" %
+              (test_recording.get_duration() / 3600, test_speed, test_server.get_address()))
+    else:
+        test_server = SolarSimulator(test_recording, test_speed, test_port)
+        print("SolarSimulator replays %.1f hours with speed %r - set Solar.base_url = %r" %
+              (test_recording.get_duration() / 3600, test_speed, test_server.get_url()))
+    try:
+        test_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    test_server.server_close()
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+import json
+
+
+class StepGenerator:
+    """ Generates the heat steps from the loads of the heaters instead of writing heatSteps.json by hand.
+
+        Every combination of heater loads is a candidate. Combinations with the same total load are
+        deduplicated, so the steps are strictly ascending. For each total the combinations are rated:
+
+        * priority: heaters with a lower 'priority' in heaters.json are heated first.
+          The cost is the sum of Watt * rank of all heaters, rank 0 for the first heater.
+        * switching: each heater changing its status between two neighbouring steps costs switching_cost.
+
+        The totals of the steps are chosen from all reachable totals at least min_step_watt apart.
+        A dynamic programming over the heaters collects the best candidates_per_total combinations
+        for each of these totals, without enumerating all combinations. A second dynamic programming over the
+        ascending totals chooses one combination per step with the lowest sum of both costs.
+    """
+
+    # number of combinations of heater loads kept for each total load
+    candidates_per_total = 8
+    # cost of a heater changing its status between two neighbouring steps, in Watt * rank
+    switching_cost = 750
+    # steps less than min_step_watt above the previous step are dropped, 0 to keep all,
+    # None for the smallest load step of a heater, e.g. 750 for the loads 'low' 750 and 'high' 1500
+    min_step_watt = None
+
+    def __init__(self, heater_list, switch_tuple=None):
+        """ Initializes the generator.
+
+        :param heater_list: list of Heater objects, their order in heaters.json is the default priority
+        :param switch_tuple: tuple of two heater names exchanging their priorities, see HeatStep.switch()
+        """
+        self.heater_list = list(heater_list)
+        ranked = sorted(range(len(self.heater_list)),
+                        key=lambda i: (self.__get_priority(self.heater_list[i], i), i))
+        self.ranks = [0] * len(self.heater_list)
+        for rank, index in enumerate(ranked):
+            self.ranks[index] = rank
+        names = [heater.name for heater in self.heater_list]
+        if switch_tuple and switch_tuple[0] in names and switch_tuple[1] in names:
+            i, j = names.index(switch_tuple[0]), names.index(switch_tuple[1])
+            self.ranks[i], self.ranks[j] = self.ranks[j], self.ranks[i]
+
+    @staticmethod
+    def __get_priority(heater, index):
+        priority = getattr(heater, "priority", None)
+        return index if priority is None else priority
+
+    def __get_candidates(self, totals) -> dict:
+        """ Collects the best combinations for every total load of totals.
+
+            Partial combinations that cannot be completed to one of the totals by the remaining heaters
+            are dropped early, so only the combinations of the chosen steps are rated.
+
+        :param totals: list of the total loads of the steps
+        :return: dict: total Watt -> list of tuples (priority cost, tuple of load names per heater)
+        """
+        remaining = self.__get_reachable_totals()
+        candidates = {0: [(0, ())]}
+        for index, heater in enumerate(self.heater_list):
+            options = [("off", 0)] + sorted(heater.load.items(), key=lambda item: (item[1], item[0]))
+            rank = self.ranks[index]
+            next_candidates = {}
+            for total, combinations in candidates.items():
+                for status, watt in options:
+                    extended = next_candidates.setdefault(total + watt, [])
+                    for cost, statuses in combinations:
+                        extended.append((cost + watt * rank, statuses + (status,)))
+            reachable = remaining[index + 1]
+            candidates = {}
+            for total, combinations in next_candidates.items():
+                if any(target - total in reachable for target in totals):
+                    combinations.sort()
+                    del combinations[self.candidates_per_total:]
+                    candidates[total] = combinations
+        return candidates
+
+    def __get_reachable_totals(self) -> list:
+        """ Collects the total loads the heaters can reach, without their combinations.
+
+        :return: list: for each index the set of totals reachable by the heaters from this index on
+        """
+        reachable = [{0}]
+        for heater in reversed(self.heater_list):
+            watts = [0] + list(heater.load.values())
+            reachable.append({total + watt for total in reachable[-1] for watt in watts})
+        reachable.reverse()
+        return reachable
+
+    def __get_min_step_watt(self) -> int:
+        """ Returns min_step_watt or, if it is None, the smallest difference between two loads of a heater,
+            including 'off'. Without it, heaters with different loads produce thousands of steps
+            only a few Watt apart.
+        """
+        if self.min_step_watt is not None:
+            return self.min_step_watt
+        steps = []
+        for heater in self.heater_list:
+            watts = sorted(set([0] + list(heater.load.values())))
+            steps.extend(b - a for a, b in zip(watts, watts[1:]))
+        return min(steps) if steps else 0
+
+    def __get_totals(self) -> list:
+        min_step_watt = self.__get_min_step_watt()
+        totals = []
+        for total in sorted(self.__get_reachable_totals()[0]):
+            if not totals or total - totals[-1] >= min_step_watt:
+                totals.append(total)
+        return totals
+
+    def generate(self) -> list:
+        """ Generates the heat steps.
+
+        :return: list of heat steps in the format of heatSteps.json: lists of [heater name, status]
+        """
+        totals, chosen = self.generate_statuses()
+        return [[[heater.name, status] for heater, status in zip(self.heater_list, statuses)] for statuses in chosen]
+
+    def generate_statuses(self) -> tuple:
+        """ Generates the heat steps in a compact form, without building the lists of heatSteps.json.
+
+        :return: tuple (list of total loads in Watt, list of tuples of the status of each heater), ascending
+        """
+        totals = self.__get_totals()
+        candidates = self.__get_candidates(totals)
+        # costs[i][j]: lowest cost of the steps up to totals[i] ending with candidate j, links[i][j]: predecessor
+        costs = [[cost for cost, statuses in candidates[totals[0]]]]
+        links = [[None] * len(costs[0])]
+        for i in range(1, len(totals)):
+            previous = candidates[totals[i - 1]]
+            step_costs = []
+            step_links = []
+            for cost, statuses in candidates[totals[i]]:
+                best_cost = None
+                best_link = None
+                for j, (previous_cost, previous_statuses) in enumerate(previous):
+                    changes = sum(1 for a, b in zip(statuses, previous_statuses) if a != b)
+                    path_cost = costs[i - 1][j] + changes * self.switching_cost
+                    if best_cost is None or path_cost < best_cost:
+                        best_cost = path_cost
+                        best_link = j
+                step_costs.append(best_cost + cost)
+                step_links.append(best_link)
+            costs.append(step_costs)
+            links.append(step_links)
+        j = min(range(len(costs[-1])), key=lambda k: costs[-1][k])
+        chosen = []
+        for i in range(len(totals) - 1, -1, -1):
+            chosen.append(candidates[totals[i]][j][1])
+            j = links[i][j]
+        chosen.reverse()
+        return totals, chosen
+
+    def to_json(self) -> str:
+        """ Returns the generated heat steps in the format of heatSteps.json, one step per line. """
+        return "[\n" + ",\n".join("    " + json.dumps(step) for step in self.generate()) + "\n]\n"
+
+
+# -------------------------------------------------------------------------------
+# Test
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    import sys
+    from heaters import Heaters
+
+    # python3 stepGenerator.py [heaters.json] > heatSteps.json
+    # python3 stepGenerator.py --timing  checks the generation time for 14 heaters with different loads
+    if len(sys.argv) > 1 and sys.argv[1] == "--timing":
+        import time
+        from types import SimpleNamespace
+
+        test_heaters = [SimpleNamespace(name="h%d" % i, load={'low': 600 + 37 * i, 'high': 1200 + 53 * i},
+                                        priority=None) for i in range(14)]
+        test_start = time.perf_counter()
+        test_steps = StepGenerator(test_heaters).generate()
+        test_seconds = time.perf_counter() - test_start
+        print("%d heaters: %d steps in %.3f s" % (len(test_heaters), len(test_steps), test_seconds))
+        assert test_seconds < 1.0, "generation too slow"
+    else:
+        if len(sys.argv) > 1:
+            Heaters.heatersFile = sys.argv[1]
+        print(StepGenerator(Heaters().list).to_json(), end="")
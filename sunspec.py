@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+# coding=UTF-8
+import socket
+import struct
+import threading
+
+from inverter import *
+
+
+class ModbusError(Exception):
+    """ The Modbus server answered with an exception or an unexpected frame. """
+    pass
+
+
+class ModbusClient:
+    """ Minimal Modbus TCP client for the function Read Holding Registers, using one persistent socket. """
+
+    # timeouts in seconds to connect to and to read from the server
+    connect_timeout_seconds = 3.05
+    read_timeout_seconds = 2
+    # maximum number of registers of one request defined by Modbus
+    max_registers = 125
+
+    sock = None
+    transaction_id = 0
+
+    def __init__(self, host, port=502):
+        self.host = host
+        self.port = port
+
+    def read_registers(self, unit_id, address, count) -> list:
+        """ Reads holding registers with the function code 3.
+
+        :param unit_id: Modbus unit id of the device
+        :param address: protocol address of the first register, e.g. 40000
+        :param count: number of registers, at most max_registers
+        :return: list of unsigned 16 bit values
+        :raises
+            OSError: if the server cannot be reached or does not answer in time
+            ModbusError: if the server answers with an exception
+        """
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout_seconds)
+            self.sock.settimeout(self.read_timeout_seconds)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.transaction_id = (self.transaction_id + 1) % 0x10000
+        self.sock.sendall(struct.pack(">HHHBBHH", self.transaction_id, 0, 6, unit_id, 3, address, count))
+        transaction_id, protocol_id, length, unit = struct.unpack(">HHHB", self.__receive(7))
+        pdu = self.__receive(length - 1)
+        if transaction_id != self.transaction_id or protocol_id != 0 or unit != unit_id:
+            raise ModbusError("Unexpected answer to transaction %d" % self.transaction_id)
+        if pdu[0] == 0x83:
+            raise ModbusError("Exception %d reading %d registers at %d" % (pdu[1], count, address))
+        if pdu[0] != 3 or pdu[1] != 2 * count:
+            raise ModbusError("Unexpected answer reading %d registers at %d" % (count, address))
+        return list(struct.unpack(">%dH" % count, pdu[2:]))
+
+    def __receive(self, size) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionResetError("Connection closed by the Modbus server")
+            data += chunk
+        return data
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class SunSpecBackend(InverterBackend):
+    """ Reads the realtime data with SunSpec Modbus TCP.
+
+        At the first read the chain of SunSpec models is walked once to find the inverter model
+        (101 - 103), the meter model (201 - 204) and the storage model (124). Then each read
+        requests the registers from the first to the last needed point in one block, split only
+        if the block is longer than 125 registers or the meter is a separate unit. This is one
+        binary request instead of two JSON requests, so the inverter can be sampled every second.
+
+        watt_pv is the DC power of the inverter, watt_grid the power of the meter, positive from
+        the grid. With a storage model watt_akku is the AC power minus the DC power of the PV
+        strings, positive while discharging, and charged_percent is its state of charge.
+    """
+
+    # protocol address of the SunSpec header 'SunS'
+    base_register = 40000
+    # maximum number of models walked to find the needed ones
+    max_models = 50
+
+    inverter_models = (101, 102, 103)
+    meter_models = (201, 202, 203, 204)
+    storage_model = 124
+    # point name -> (model group, offset of the register after the model header)
+    point_offsets = {"inverter": {"W": 12, "W_SF": 13, "DCW": 29, "DCW_SF": 30},
+                     "meter": {"W": 16, "W_SF": 20},
+                     "storage": {"ChaState": 6, "ChaState_SF": 20}}
+
+    # (unit id, first address, count) of the block reads, found by the first read
+    blocks = None
+    # (model group, point name) -> (unit id, address)
+    points = None
+
+    def __init__(self, host, port=502, unit_id=1, meter_unit_id=None):
+        """ Initializes the connection to the inverter without connecting.
+
+        :param host: host of the Modbus TCP server of the inverter
+        :param port: port of the Modbus TCP server
+        :param unit_id: unit id of the inverter
+        :param meter_unit_id: unit id of the meter, None if the inverter provides the meter model
+        """
+        self.client = ModbusClient(host, port)
+        self.unit_id = unit_id
+        self.meter_unit_id = unit_id if meter_unit_id is None else meter_unit_id
+        self.lock = threading.Lock()
+
+    def read(self) -> dict:
+        """ Reads power flow and state of charge in one block of registers.
+
+        :raises
+            OSError: if the inverter cannot be reached or does not answer in time
+            ModbusError: if the inverter answers with an exception or provides no SunSpec models
+        """
+        with self.lock:
+            try:
+                if self.points is None:
+                    self.__discover()
+                values = {}
+                for unit_id, address, count in self.blocks:
+                    for i, value in enumerate(self.client.read_registers(unit_id, address, count)):
+                        values[(unit_id, address + i)] = value
+            except Exception:
+                self.client.close()
+                raise
+        point = {key: values[location] for key, location in self.points.items()}
+        watt_ac = self.__scale(point, "inverter", "W", "W_SF")
+        watt_pv = self.__scale(point, "inverter", "DCW", "DCW_SF")
+        if watt_pv is None:
+            watt_pv = watt_ac or 0
+        watt_grid = self.__scale(point, "meter", "W", "W_SF") or 0
+        watt_akku = 0
+        charged_percent = 0
+        if ("storage", "ChaState") in point:
+            watt_akku = (watt_ac or 0) - watt_pv
+            charged_percent = self.__scale(point, "storage", "ChaState", "ChaState_SF") or 0
+        return {"watt_pv": watt_pv,
+                "watt_load": -(watt_pv + watt_grid + watt_akku),
+                "watt_akku": watt_akku,
+                "watt_grid": watt_grid,
+                "charged_percent": charged_percent}
+
+    @staticmethod
+    def __scale(point, group, name, scale_factor_name):
+        """ Returns the value of an int16 point multiplied by its scale factor, None if not implemented. """
+        value = point[(group, name)]
+        scale_factor = point[(group, scale_factor_name)]
+        if value == 0x8000 or scale_factor == 0x8000:
+            return None
+        value = value - 0x10000 if value > 0x8000 else value
+        scale_factor = scale_factor - 0x10000 if scale_factor > 0x8000 else scale_factor
+        return value * 10 ** scale_factor
+
+    def __discover(self) -> None:
+        """ Walks the SunSpec models of the inverter and the meter and plans the block reads. """
+        models = self.__find_models(self.unit_id)
+        if self.meter_unit_id != self.unit_id:
+            models["meter"] = self.__find_models(self.meter_unit_id).get("meter")
+        if models.get("inverter") is None or models.get("meter") is None:
+            raise ModbusError("No SunSpec inverter or meter model found")
+        points = {}
+        for group, location in models.items():
+            if location is not None:
+                unit_id, start = location
+                for name, offset in self.point_offsets[group].items():
+                    points[(group, name)] = (unit_id, start + offset)
+        blocks = []
+        for unit_id in sorted({unit_id for unit_id, address in points.values()}):
+            addresses = sorted(address for unit, address in points.values() if unit == unit_id)
+            first = addresses[0]
+            while first is not None:
+                last = max(address for address in addresses if address < first + ModbusClient.max_registers)
+                blocks.append((unit_id, first, last - first + 1))
+                first = next((address for address in addresses if address > last), None)
+        self.points = points
+        self.blocks = blocks
+
+    def __find_models(self, unit_id) -> dict:
+        """ Returns the model group -> (unit id, address of the first register after the model header). """
+        if self.client.read_registers(unit_id, self.base_register, 2) != [0x5375, 0x6e53]:
+            raise ModbusError("No SunSpec header at %d of unit %d" % (self.base_register, unit_id))
+        models = {}
+        address = self.base_register + 2
+        for _ in range(self.max_models):
+            model_id, length = self.client.read_registers(unit_id, address, 2)
+            if model_id == 0xFFFF:
+                break
+            if model_id in self.inverter_models:
+                models.setdefault("inverter", (unit_id, address + 2))
+            elif model_id in self.meter_models:
+                models.setdefault("meter", (unit_id, address + 2))
+            elif model_id == self.storage_model:
+                models.setdefault("storage", (unit_id, address + 2))
+            address += 2 + length
+        return models
+
+    def close(self) -> None:
+        with self.lock:
+            self.client.close()
+
+
+# -------------------------------------------------------------------------------
+# Test
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    import sys
+
+    # python3 sunspec.py [host] [port], e.g. 127.0.0.1 8502 for the stand-in of solarSimulator.py
+    test_backend = SunSpecBackend(sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1",
+                                  int(sys.argv[2]) if len(sys.argv) > 2 else 8502)
+    print(test_backend.read())
+    print("blocks %r" % test_backend.blocks)
+    test_backend.close()
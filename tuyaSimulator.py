@@ -0,0 +1,382 @@
+#!/usr/bin/python3
+# coding=UTF-8
+
+import json
+import os
+import queue
+import random
+import socket
+import tempfile
+import threading
+import time
+
+from heater import *
+
+
+class VirtualDevice:
+    """ State of one virtual heater device of the TuyaSimulator.
+
+        The DPS dictionary has the same structure as the one of a real heater:
+        {'1': False, '2': 20, '3': 20, '4': 'low', '12': 0}
+    """
+
+    def __init__(self, name, dev_id, ip, key, load=None, is_on_index=1, load_index=4):
+        self.name = name
+        self.id = dev_id
+        self.ip = ip
+        self.key = key
+        self.load = {'low': 750, 'high': 1500} if load is None else dict(load)
+        self.is_on_index = is_on_index
+        self.load_index = load_index
+        self.dps = {'1': False, '2': 20, '3': 20, '4': 'low', '12': 0}
+        self.dps[str(load_index)] = list(self.load)[0]
+        # list of tuples (start, end) in seconds since the start of the simulator
+        self.offline_windows = []
+        self.offline = False
+        # DPS updates pushed to the receive() of the connected OutletDevice
+        self.pushed = queue.Queue()
+        # one byte per pushed update makes the socket of the connected OutletDevice readable for select()
+        self.push_reader, self.push_writer = socket.socketpair()
+        self.push_reader.setblocking(False)
+        self.round_trips = 0
+        self.lock = threading.Lock()
+
+    def get_watt(self) -> int:
+        """ Returns the power the virtual heater currently draws according to its load definition. """
+        with self.lock:
+            if not self.dps.get(str(self.is_on_index), False):
+                return 0
+            return self.load.get(self.dps.get(str(self.load_index)), 0)
+
+    def is_offline(self, seconds) -> bool:
+        if self.offline:
+            return True
+        for start, end in self.offline_windows:
+            if start <= seconds < end:
+                return True
+        return False
+
+
+class VirtualOutletDevice:
+    """ Drop-in replacement for tinytuya.OutletDevice, talking to a VirtualDevice of the TuyaSimulator.
+
+        Supports the functions used by the class Heater. Every request waits for the latency of the
+        simulator, can get lost like a UDP packet and fails like TinyTuya if the device is offline.
+    """
+
+    simulator = None
+
+    def __init__(self, dev_id, address=None, local_key="", dev_type="default", connection_timeout=5):
+        self.id = dev_id
+        self.address = address
+        self.local_key = local_key
+        self.version = 3.1
+        self.socketPersistent = False
+        self.connection_timeout = connection_timeout
+        self.socketRetryLimit = 5
+        # like TinyTuya: opened by the first request, None after close()
+        self.socket = None
+        if dev_id not in self.simulator.devices:
+            raise ValueError("Unknown virtual device id %r" % dev_id)
+        self.device = self.simulator.devices[dev_id]
+
+    # --------------------------------
+    # connection settings
+    # --------------------------------
+
+    def set_version(self, version):
+        self.version = version
+
+    def set_socketPersistent(self, persist):
+        self.socketPersistent = persist
+
+    def set_socketTimeout(self, s):
+        self.connection_timeout = s
+
+    def set_socketRetryLimit(self, limit):
+        self.socketRetryLimit = limit
+
+    def close(self):
+        self.socket = None
+
+    # --------------------------------
+    # requests and commands
+    # --------------------------------
+
+    def status(self, nowait=False):
+        return self.__send_receive(lambda dps: None)
+
+    def heartbeat(self, nowait=True):
+        # like TinyTuya: the answer to a heartbeat has no payload, so waiting for it lasts until the socket timeout
+        if nowait:
+            return self.__send()
+        result = self.__send_receive(lambda dps: None)
+        if "Error" in result:
+            return result
+        time.sleep(self.simulator.scaled(self.connection_timeout))
+        return None
+
+    def turn_on(self, switch=1, nowait=False):
+        return self.set_value(switch, True, nowait)
+
+    def turn_off(self, switch=1, nowait=False):
+        return self.set_value(switch, False, nowait)
+
+    def set_value(self, index, value, nowait=False):
+        return self.set_multiple_values({str(index): value}, nowait)
+
+    def set_multiple_values(self, data, nowait=False):
+        return self.__send_receive(lambda dps: dps.update({str(k): v for k, v in data.items()}))
+
+    def receive(self):
+        """ Waits at most connection_timeout for a DPS update pushed by the virtual device.
+
+        :return: dict: {'devId': ..., 'dps': {...}} or None if there was no update
+        """
+        try:
+            dps = self.device.pushed.get(timeout=self.simulator.scaled(self.connection_timeout))
+        except queue.Empty:
+            return None
+        try:
+            self.device.push_reader.recv(1)
+        except BlockingIOError:
+            pass
+        return {'devId': self.id, 'dps': dps}
+
+    def __send(self):
+        """ Simulates a request sent without waiting for the answer. Only an offline device lets it fail.
+
+        :return: None or an error dictionary like TinyTuya
+        """
+        for attempt in range(self.socketRetryLimit):
+            with self.device.lock:
+                self.device.round_trips += 1
+            if self.device.is_offline(self.simulator.get_seconds()):
+                time.sleep(self.simulator.scaled(self.connection_timeout))
+                continue
+            return None
+        return {'Error': 'Network Error: Device Unreachable', 'Err': '905', 'Payload': None}
+
+    def __send_receive(self, change) -> dict:
+        """ Simulates a request with latency, lost packets and offline windows.
+
+        :param change: function applying the command to the DPS dictionary of the device
+        :return: dict: status like TinyTuya or an error dictionary
+        """
+        simulator = self.simulator
+        for attempt in range(self.socketRetryLimit):
+            with self.device.lock:
+                self.device.round_trips += 1
+            if self.device.is_offline(simulator.get_seconds()):
+                time.sleep(simulator.scaled(self.connection_timeout))
+                continue
+            time.sleep(simulator.get_latency())
+            if simulator.random.random() < simulator.loss_rate:
+                time.sleep(simulator.scaled(self.connection_timeout))
+                continue
+            self.socket = self.device.push_reader
+            with self.device.lock:
+                change(self.device.dps)
+                return {'devId': self.id, 'dps': dict(self.device.dps)}
+        return {'Error': 'Network Error: Device Unreachable', 'Err': '905', 'Payload': None}
+
+
+class TuyaSimulator:
+    """ Simulates a number of virtual heaters for offline tests and load benchmarks.
+
+        The simulator provides the definitions for heaters.json and heatSteps.json and replaces
+        tinytuya.OutletDevice in the class Heater by VirtualOutletDevice with install().
+        Latency, packet loss and offline windows are configurable. All waiting times, including
+        the TinyTuya socket timeouts, are multiplied by time_scale.
+    """
+
+    # latency of each request in seconds and its random variation
+    latency_seconds = 0.02
+    latency_jitter_seconds = 0.01
+    # probability that a request gets lost
+    loss_rate = 0.0
+    # factor for all waiting times, e.g. 0.01 to run a benchmark 100 times faster
+    time_scale = 1.0
+
+    devices = {}
+    device_list = []
+    start_time = 0
+    random = None
+
+    def __init__(self, count, latency_seconds=0.02, latency_jitter_seconds=0.01, loss_rate=0.0, time_scale=1.0,
+                 seed=None):
+        """ Creates count virtual heaters named 'v0', 'v1', ... with the loads 'low' and 'high'.
+
+        :param count: number of virtual heaters
+        :param latency_seconds: latency of each request in seconds
+        :param latency_jitter_seconds: random variation of the latency in seconds
+        :param loss_rate: probability that a request gets lost
+        :param time_scale: factor for all waiting times
+        :param seed: seed of the random generator, to reproduce a run
+        """
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.loss_rate = loss_rate
+        self.time_scale = time_scale
+        self.random = random.Random(seed)
+        self.devices = {}
+        self.device_list = []
+        for i in range(count):
+            self.add_device(VirtualDevice("v%d" % i, "virtual%012d" % i, "127.0.%d.%d" % (i // 250, i % 250 + 1),
+                                          "%016x" % i))
+        self.start_time = clock.time()
+
+    @classmethod
+    def for_definitions(cls, definitions, **kwargs):
+        """ Creates a simulator with one virtual heater for each heater definition, e.g. of heaters.json.
+
+        :param definitions: list of heater dictionaries in the format of heaters.json
+        :param kwargs: further parameters of the constructor
+        :return: TuyaSimulator
+        """
+        simulator = cls(0, **kwargs)
+        for definition in definitions:
+            simulator.add_device(VirtualDevice(definition['name'], definition['id'], definition['ip'],
+                                               definition['key'], definition['load'], definition['isOnIndex'],
+                                               definition['loadIndex']))
+        return simulator
+
+    def add_device(self, device) -> None:
+        self.devices[device.id] = device
+        self.device_list.append(device)
+
+    def get_seconds(self) -> float:
+        """ Returns the seconds since the start of the simulator. """
+        return clock.time() - self.start_time
+
+    def get_latency(self) -> float:
+        jitter = self.random.uniform(-self.latency_jitter_seconds, self.latency_jitter_seconds)
+        return self.scaled(max(self.latency_seconds + jitter, 0))
+
+    def scaled(self, seconds) -> float:
+        return seconds * self.time_scale
+
+    def get_device(self, name) -> VirtualDevice:
+        for device in self.device_list:
+            if device.name == name:
+                return device
+        raise ValueError("Unknown virtual heater name %r" % name)
+
+    def get_round_trips(self) -> int:
+        """ Returns the number of requests sent to all virtual heaters, including the lost ones. """
+        return sum(device.round_trips for device in self.device_list)
+
+    def reset_round_trips(self) -> None:
+        for device in self.device_list:
+            device.round_trips = 0
+
+    def get_total_watt(self) -> int:
+        """ Returns the power all virtual heaters currently draw. """
+        return sum(device.get_watt() for device in self.device_list)
+
+    def get_heater_definitions(self) -> list:
+        """ Returns the definitions of the virtual heaters in the format of heaters.json.
+
+        :return: list of heater dictionaries
+        """
+        return [{'enable': "True", 'name': device.name, 'ip': device.ip, 'id': device.id, 'key': device.key,
+                 'isOnIndex': device.is_on_index, 'loadIndex': device.load_index, 'load': dict(device.load)}
+                for device in self.device_list]
+
+    def get_heat_step_definitions(self) -> list:
+        """ Returns ascending heat steps in the format of heatSteps.json, like the example with three heaters.
+
+            Starting with all heaters off, one heater after another is set to its loads in ascending order.
+        """
+        names = [device.name for device in self.device_list]
+        statuses = ["off"] * len(names)
+        steps = [[[name, status] for name, status in zip(names, statuses)]]
+        for i, device in enumerate(self.device_list):
+            for load in sorted(device.load, key=device.load.get):
+                statuses[i] = load
+                steps.append([[name, status] for name, status in zip(names, statuses)])
+        return steps
+
+    def write_definition_files(self, directory=None) -> tuple:
+        """ Writes heaters.json and heatSteps.json for the virtual heaters.
+
+        :param directory: target directory, by default a new temporary directory
+        :return: tuple: paths of the heaters file and the heat steps file
+        """
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix="solarheat")
+        heaters_file = os.path.join(directory, "heaters.json")
+        heat_steps_file = os.path.join(directory, "heatSteps.json")
+        with open(heaters_file, 'w') as f:
+            json.dump(self.get_heater_definitions(), f, indent=4)
+        with open(heat_steps_file, 'w') as f:
+            json.dump(self.get_heat_step_definitions(), f)
+        return heaters_file, heat_steps_file
+
+    def install(self) -> None:
+        """ Lets all Heater objects connect to the virtual heaters of this simulator. """
+        VirtualOutletDevice.simulator = self
+        Heater.deviceClass = VirtualOutletDevice
+
+    def set_offline(self, name, offline=True) -> None:
+        """ Takes a virtual heater off the network or brings it back. """
+        self.get_device(name).offline = offline
+
+    def add_offline_window(self, name, start_seconds, end_seconds) -> None:
+        """ Takes a virtual heater off the network between two points in time since the start of the simulator. """
+        self.get_device(name).offline_windows.append((start_seconds, end_seconds))
+
+    def change_by_hand(self, name, dps) -> None:
+        """ Simulates a manual change at the heater, which is pushed to the connected OutletDevice.
+
+        :param name: name of the virtual heater
+        :param dps: dictionary of the changed DPS values, e.g. {'1': True}
+        """
+        device = self.get_device(name)
+        with device.lock:
+            device.dps.update(dps)
+        device.push_writer.send(b"\0")
+        device.pushed.put(dict(dps))
+
+
+# -------------------------------------------------------------------------------
+# Test
+# -------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    import sys
+
+    test_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    test_simulator = TuyaSimulator(test_count, latency_seconds=0.05, loss_rate=0.02, time_scale=0.1, seed=1)
+    test_simulator.install()
+    Heater.connectErrorRetryMinSeconds = 1
+    # the definition files have to be set before the module heat creates the Heaters object
+    test_heaters_file, test_heat_steps_file = test_simulator.write_definition_files()
+    import heaters as heaters_module
+    heaters_module.Heaters.heatersFile = test_heaters_file
+    from heatSteps import *
+
+    HeatSteps.heatStepsFile = test_heat_steps_file
+    test_heat_steps = HeatSteps()
+    print("%d virtual heaters, %d heat steps" % (len(heaters.list), test_heat_steps.get_step_count()))
+
+    test_start = time.time()
+    heaters.update_status()
+    print("update_status: %.3f s, %d round trips" % (time.time() - test_start, test_simulator.get_round_trips()))
+
+    test_simulator.reset_round_trips()
+    test_start = time.time()
+    for test_step in test_heat_steps.get_list():
+        test_step.set_all_heater(verbose=False)
+    print("all steps ascending: %.3f s, %d round trips" %
+          (time.time() - test_start, test_simulator.get_round_trips()))
+
+    test_simulator.set_offline("v0")
+    heaters.update_status()
+    print("v0 offline:", heaters.dict["v0"].get_short_status())
+    test_simulator.set_offline("v0", False)
+    time.sleep(Heater.connectErrorRetryMinSeconds)
+    heaters.update_status()
+    print("v0 online again:", heaters.dict["v0"].get_short_status(),
+          "dynamic configuration change:", heaters.is_dynamic_configuration_change())